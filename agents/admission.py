@@ -0,0 +1,148 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted; reply 429 with ``retry_after``."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class Ticket:
+    __slots__ = ('client', 'enqueued_at', 'admitted_at', 'queue_depth')
+
+    def __init__(self, client, queue_depth):
+        self.client = client
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.queue_depth = queue_depth
+
+    @property
+    def wait_ms(self):
+        return round(((self.admitted_at or time.monotonic()) - self.enqueued_at) * 1000, 1)
+
+
+class AdmissionController:
+    """Admission control in front of the expensive /ask handler.
+
+    At most ``max_concurrent`` requests run at once; the rest wait in a FIFO
+    queue of at most ``max_queue`` entries, for at most ``queue_timeout``
+    seconds. Each client (by IP) also has a token bucket of
+    ``client_rate`` requests per minute with bursts of ``client_burst``.
+    Anything over a limit is rejected straight away with a Retry-After hint
+    rather than piling up behind the agents.
+    """
+
+    def __init__(self, max_concurrent=None, max_queue=None, queue_timeout=None, client_rate=None,
+                 client_burst=None):
+        self.max_concurrent = max_concurrent or int(os.environ.get("ASK_MAX_CONCURRENT", 8))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get("ASK_MAX_QUEUE", 32))
+        self.queue_timeout = queue_timeout or float(os.environ.get("ASK_QUEUE_TIMEOUT", 10))
+        self.client_rate = client_rate if client_rate is not None else float(os.environ.get("ASK_CLIENT_RATE", 30))
+        self.client_burst = client_burst or float(os.environ.get("ASK_CLIENT_BURST", 10))
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.active = 0
+        self.clients = {}
+        # Smoothed time a request holds a slot, for Retry-After estimates
+        self.service_time = 1.0
+        self.wait_time = 0.0
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+
+    def _take_client_token(self, client, now):
+        if self.client_rate <= 0:
+            return 0
+        tokens, updated = self.clients.get(client, (self.client_burst, now))
+        tokens = min(self.client_burst, tokens + (now - updated) * self.client_rate / 60.0)
+        if tokens < 1:
+            self.clients[client] = (tokens, now)
+            return (1 - tokens) * 60.0 / self.client_rate
+        self.clients[client] = (tokens - 1, now)
+        if len(self.clients) > 10000:
+            # Forget clients whose buckets have refilled anyway
+            full_after = self.client_burst * 60.0 / self.client_rate
+            self.clients = {key: value for key, value in self.clients.items() if now - value[1] < full_after}
+        return 0
+
+    def _estimate_wait(self, position):
+        return self.service_time * (position + 1) / self.max_concurrent
+
+    def acquire(self, client):
+        """Wait for a slot and return a Ticket, or raise Rejected."""
+        with self.condition:
+            now = time.monotonic()
+            retry_after = self._take_client_token(client, now)
+            if retry_after:
+                self.rejected["rate_limited"] += 1
+                raise Rejected(f"Rate limit exceeded for {client}", retry_after)
+            if len(self.queue) >= self.max_queue and self.active >= self.max_concurrent:
+                self.rejected["queue_full"] += 1
+                raise Rejected("Server busy: request queue is full", self._estimate_wait(len(self.queue)))
+
+            ticket = Ticket(client, len(self.queue))
+            self.queue.append(ticket)
+            deadline = ticket.enqueued_at + self.queue_timeout
+            while self.queue[0] is not ticket or self.active >= self.max_concurrent:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.queue.remove(ticket)
+                    self.rejected["queue_timeout"] += 1
+                    self.condition.notify_all()
+                    raise Rejected(f"Server busy: waited {self.queue_timeout:g}s for a slot",
+                                   self._estimate_wait(len(self.queue)))
+                self.condition.wait(remaining)
+
+            self.queue.popleft()
+            self.active += 1
+            ticket.admitted_at = time.monotonic()
+            self.admitted += 1
+            self.wait_time = 0.9 * self.wait_time + 0.1 * (ticket.admitted_at - ticket.enqueued_at)
+            # The next in line may be able to go too
+            self.condition.notify_all()
+            return ticket
+
+    def release(self, ticket):
+        with self.condition:
+            self.active -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "active": self.active,
+                "queue_depth": len(self.queue),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "avg_wait_ms": round(self.wait_time * 1000, 1),
+                "avg_service_ms": round(self.service_time * 1000, 1),
+            }
+
+
+def client_id(request, trusted_hops=None):
+    """Identify the caller of a Flask request for per-client limits.
+
+    X-Forwarded-For is only believed as far as our own proxies wrote it:
+    with TRUSTED_PROXY_HOPS proxies in front of the app (such as the
+    Spaces/nginx one), the client is the entry the outermost of them
+    appended, counting from the right. Entries further left come from the
+    client, which could rotate them to dodge its rate limit. With no
+    trusted proxies (the default) the peer address is used.
+    """
+    if trusted_hops is None:
+        trusted_hops = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+    forwarded = request.headers.get('X-Forwarded-For')
+    if trusted_hops > 0 and forwarded:
+        entries = [entry.strip() for entry in forwarded.split(',')]
+        # Fewer entries than proxies: the leftmost is still one a proxy wrote
+        return entries[-min(trusted_hops, len(entries))] or 'unknown'
+    return request.remote_addr or 'unknown'
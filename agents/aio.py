@@ -0,0 +1,69 @@
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+# Short blocking jobs from coroutines (parsing, cache files) run here. The
+# loop's default executor is left alone: anything can queue on it, so a
+# backlog of slow calls there would hold up these quick ones.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the process-wide event loop, started on a daemon thread on
+    first use. Async agent code runs here, so one loop (and one set of
+    Gemini async channels) serves every request thread."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """Run ``coro`` on the shared loop and block until it finishes. This is
+    what the agents' synchronous methods are built on."""
+    loop = get_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync called from the event loop thread; await the coroutine instead")
+    context = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_in_context(context, coro), loop).result(timeout)
+
+
+def get_pool():
+    """Return the shared executor for short blocking jobs, sized by
+    AIO_POOL_SIZE (default 8)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.environ.get("AIO_POOL_SIZE", 8)),
+                                       thread_name_prefix="aio-blocking")
+        return _pool
+
+
+async def run_blocking(fn, *args, executor=None, **kwargs):
+    """Like ``asyncio.to_thread``, but on ``executor`` (default ``get_pool()``)
+    rather than the loop's default executor. Clients whose calls can wait a
+    long time (upstream HTTP, Gemini) pass their own, so they only queue
+    behind each other."""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor or get_pool(), call)
+
+
+async def _in_context(context, coro):
+    # Carry the caller's context variables (such as its trace) onto the loop;
+    # the task has its own copy, so this does not leak into other tasks
+    for var, value in context.items():
+        var.set(value)
+    return await coro
@@ -1,60 +1,152 @@
 ﻿import os
-import requests
-import google.generativeai as genai
 import xml.etree.ElementTree as ET
 from urllib.parse import quote
+from agents.cache import TieredCache, normalize_query
+from agents.http_client import get_client
+from agents.gemini_client import get_gemini
+from agents.models import Paper
+from agents.aio import run_sync, run_blocking
+from agents.singleflight import SingleFlight
+from agents.tracing import span
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+# Overridable so benchmarks can point at a local stand-in
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+
+def arxiv_url(query, max_results):
+    # Search ArXiv API
+    return f"{ARXIV_API_URL}?search_query=all:{quote(query)}&start=0&max_results={max_results}"
+
+def format_papers(papers):
+    """Numbered plain-text listing of ``Paper`` records, summaries cut short."""
+    lines = []
+    for i, paper in enumerate(papers, 1):
+        lines += [
+            f"{i}. {paper.title}",
+            f"   Authors: {paper.authors}",
+            f"   Published: {paper.published}",
+            f"   Summary: {paper.summary[:300]}...",
+            f"   URL: {paper.url}",
+            "",
+        ]
+    return "\n".join(lines)
 
 class ArxivAgent:
-    def __init__(self):
-        pass
+    def __init__(self, query_cache=None, paper_cache=None, http=None, gemini=None):
+        self.http = http or get_client()
+        self.gemini = gemini or get_gemini()
+        # Identical searches already in flight are joined, not repeated
+        self.flights = SingleFlight()
+        # arXiv results change at most daily. Queries map to lists of arXiv
+        # ids; the paper records themselves are stored once per id, so
+        # overlapping queries share them
+        ttl = int(os.environ.get("ARXIV_CACHE_TTL", 24 * 3600))
+        self.query_cache = query_cache or TieredCache("arxiv_query", ttl=ttl, stale_ttl=0, negative_ttl=ttl // 4)
+        self.paper_cache = paper_cache or TieredCache("arxiv_paper", ttl=30 * 24 * 3600, stale_ttl=0, max_items=4096)
+    
+    def fetch_papers(self, query, max_results=5):
+        """Return ``Paper`` records for ``query``, from cache when possible.
+        
+        Returns None when the arXiv API answers with an error status.
+        """
+        key = f"{normalize_query(query)}|{max_results}"
+        return self.flights.do(f"papers|{key}", lambda: self._fetch_papers(key, query, max_results))
+    
+    def _fetch_papers(self, key, query, max_results):
+        papers = self._cached_papers(key)
+        if papers is not None:
+            return papers
+        
+        with span("arxiv.fetch"):
+            response = self.http.get(arxiv_url(query, max_results))
+        if response.status_code != 200:
+            return None
+        
+        papers = self._parse_papers(response.content)
+        self.query_cache.set(key, [paper.id for paper in papers], negative=not papers)
+        return papers
+    
+    async def fetch_papers_async(self, query, max_results=5):
+        key = f"{normalize_query(query)}|{max_results}"
+        # One SQLite read per paper on a miss in memory: run them in a thread
+        papers = await run_blocking(self._cached_papers, key)
+        if papers is not None:
+            return papers
+        
+        with span("arxiv.fetch"):
+            response = await self.http.get_async(arxiv_url(query, max_results))
+        if response.status_code != 200:
+            return None
+        
+        # XML parsing is CPU work: keep it off the event loop
+        papers = await run_blocking(self._parse_papers, response.content)
+        await self.query_cache.set_async(key, [paper.id for paper in papers], negative=not papers)
+        return papers
+    
+    def _cached_papers(self, key):
+        paper_ids, state = self.query_cache.get(key)
+        if state:
+            papers = [self.paper_cache.get(paper_id)[0] for paper_id in paper_ids]
+            if all(papers):
+                return [Paper.from_dict(paper) for paper in papers]
+        return None
+    
+    def _parse_papers(self, content):
+        with span("arxiv.parse"):
+            return self._extract_papers(content)
+    
+    def _extract_papers(self, content):
+        # Parse XML response
+        root = ET.fromstring(content)
+        
+        # Extract paper information
+        papers = []
+        for entry in root.findall(f'{ATOM}entry'):
+            pdf_link = entry.find(f'{ATOM}id').text
+            paper_id = pdf_link.rsplit('/abs/', 1)[-1]
+            cached, _ = self.paper_cache.get(paper_id)
+            if cached:
+                papers.append(Paper.from_dict(cached))
+                continue
+            
+            title = entry.find(f'{ATOM}title').text.strip()
+            summary = entry.find(f'{ATOM}summary').text.strip()
+            authors = [author.find(f'{ATOM}name').text 
+                     for author in entry.findall(f'{ATOM}author')]
+            published = entry.find(f'{ATOM}published').text
+            
+            paper = Paper(
+                id=paper_id,
+                title=title,
+                authors=', '.join(authors),
+                summary=summary,
+                published=published[:10],  # Just date part
+                url=pdf_link
+            )
+            self.paper_cache.set(paper_id, paper.to_dict())
+            papers.append(paper)
+        return papers
     
     def search_papers(self, query, max_results=5):
+        return run_sync(self.search_papers_async(query, max_results))
+    
+    async def search_papers_async(self, query, max_results=5):
+        key = f"{normalize_query(query)}|{max_results}"
+        return await self.flights.do_async(key, lambda: self._search_papers_async(query, max_results))
+    
+    async def _search_papers_async(self, query, max_results):
         try:
             # Get API key from environment
             api_key = os.environ.get("GEMINI_API_KEY")
             if not api_key:
                 return "Error: GEMINI_API_KEY not found in environment variables"
                 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
-            # Search ArXiv API
-            search_query = quote(query)
-            arxiv_url = f"http://export.arxiv.org/api/query?search_query=all:{search_query}&start=0&max_results={max_results}"
-            
-            response = requests.get(arxiv_url, timeout=10)
+            papers = await self.fetch_papers_async(query, max_results)
             
-            if response.status_code == 200:
-                # Parse XML response
-                root = ET.fromstring(response.content)
-                
-                # Extract paper information
-                papers = []
-                for entry in root.findall('{http://www.w3.org/2005/Atom}entry'):
-                    title = entry.find('{http://www.w3.org/2005/Atom}title').text.strip()
-                    summary = entry.find('{http://www.w3.org/2005/Atom}summary').text.strip()
-                    authors = [author.find('{http://www.w3.org/2005/Atom}name').text 
-                             for author in entry.findall('{http://www.w3.org/2005/Atom}author')]
-                    published = entry.find('{http://www.w3.org/2005/Atom}published').text
-                    pdf_link = entry.find('{http://www.w3.org/2005/Atom}id').text
-                    
-                    papers.append({
-                        'title': title,
-                        'authors': ', '.join(authors),
-                        'summary': summary,
-                        'published': published[:10],  # Just date part
-                        'url': pdf_link
-                    })
-                
+            if papers is not None:
                 if papers:
                     # Format papers for AI analysis
-                    papers_text = ""
-                    for i, paper in enumerate(papers, 1):
-                        papers_text += f"{i}. {paper['title']}\n"
-                        papers_text += f"   Authors: {paper['authors']}\n"
-                        papers_text += f"   Published: {paper['published']}\n"
-                        papers_text += f"   Summary: {paper['summary'][:300]}...\n"
-                        papers_text += f"   URL: {paper['url']}\n\n"
+                    papers_text = format_papers(papers)
                     
                     # Use AI to provide research summary
                     prompt = f"""
@@ -71,7 +163,7 @@ Please provide a comprehensive research summary that:
 Be scholarly but accessible in your response.
 """
                     
-                    ai_response = model.generate_content(prompt)
+                    ai_response = await self.gemini.generate_async(prompt)
                     
                     return f"ArXiv research results for '{query}':\n\n{ai_response.text}\n\nPapers found:\n{papers_text}"
                 
@@ -92,7 +184,7 @@ Please provide helpful guidance about this research topic, including:
 Note that ArXiv search is currently unavailable.
 """
                 
-                ai_response = model.generate_content(prompt)
+                ai_response = await self.gemini.generate_async(prompt)
                 return f"Research guidance for '{query}' (ArXiv search unavailable):\n\n{ai_response.text}"
                 
         except Exception as e:
@@ -100,16 +192,13 @@ Note that ArXiv search is currently unavailable.
             try:
                 api_key = os.environ.get("GEMINI_API_KEY")
                 if api_key:
-                    genai.configure(api_key=api_key)
-                    model = genai.GenerativeModel('gemini-2.0-flash')
-                    
                     prompt = f"""
 The user is researching: "{query}"
 
 Please provide helpful information about this research topic based on your knowledge.
 """
                     
-                    ai_response = model.generate_content(prompt)
+                    ai_response = await self.gemini.generate_async(prompt)
                     return f"Research information for '{query}' (ArXiv search error):\n\n{ai_response.text}"
                 else:
                     return f"Error searching ArXiv: {str(e)}"
@@ -0,0 +1,233 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from agents.aio import run_blocking
+
+DEFAULT_DB_PATH = os.environ.get("CACHE_DB_PATH", os.path.join("cache", "cache.sqlite3"))
+
+# Background refreshes for stale entries share this small pool
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+
+def _classify(entry, now):
+    """``(value, state)`` for a ``(value, expires_at, stale_until)`` entry."""
+    if entry is None:
+        return None, None
+    value, expires_at, stale_until = entry
+    if now < expires_at:
+        return value, "fresh"
+    if now < stale_until:
+        return value, "stale"
+    return None, None
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive cache key for a user query."""
+    return " ".join(query.lower().split())
+
+
+class TieredCache:
+    """Two-tier TTL cache: an in-process LRU in front of a SQLite table that
+    every worker process on the host shares.
+
+    An entry is fresh for ``ttl`` seconds and may then be served stale for
+    another ``stale_ttl`` seconds while ``fetch`` refreshes it in the
+    background. "Nothing found" answers are cached too, for ``negative_ttl``.
+    Values must be JSON-serializable.
+
+    Rows past their stale window are deleted from SQLite every
+    ``purge_every`` writes, so the table tracks the live entries rather than
+    every query ever seen.
+
+    Coroutines use ``get_async``, ``set_async`` and ``fetch_async``, which
+    keep SQLite (and its lock waits) off the event loop.
+    """
+
+    def __init__(self, namespace, ttl=3600, stale_ttl=None, negative_ttl=None, max_items=1024,
+                 db_path=DEFAULT_DB_PATH, purge_every=500):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl if stale_ttl is not None else ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.max_items = max_items
+        self.db_path = db_path
+        self.purge_every = purge_every
+        self.writes = 0
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.refreshing = set()
+        # Keeps background refresh tasks referenced until they finish
+        self.tasks = set()
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._db() as db:
+                db.execute("""CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stale_until REAL NOT NULL,
+                    PRIMARY KEY (namespace, key))""")
+                db.execute("CREATE INDEX IF NOT EXISTS cache_stale_until ON cache (stale_until)")
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _db(self):
+        # sqlite3 connections cannot be shared between threads
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """Return ``(value, state)``: state is "fresh", "stale" or None (miss)."""
+        if not self.enabled:
+            return None, None
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+
+        if entry is None and self.db_path:
+            try:
+                row = self._db().execute(
+                    "SELECT value, expires_at, stale_until FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Cache read error ({self.namespace}): {e}")
+                row = None
+            if row is not None:
+                entry = (json.loads(row[0]), row[1], row[2])
+                self._remember(key, entry)
+
+        return _classify(entry, now)
+
+    async def get_async(self, key):
+        """``get`` for coroutines: memory hits are answered on the loop,
+        SQLite reads run in a thread."""
+        if not self.enabled:
+            return None, None
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+        if entry is None and self.db_path:
+            return await run_blocking(self.get, key)
+        return _classify(entry, time.time())
+
+    def set(self, key, value, negative=False):
+        if not self.enabled:
+            return
+        ttl = self.negative_ttl if negative else self.ttl
+        expires_at = time.time() + ttl
+        stale_until = expires_at + self.stale_ttl
+        self._remember(key, (value, expires_at, stale_until))
+        if self.db_path:
+            with self.lock:
+                self.writes += 1
+                purge = self.purge_every and self.writes % self.purge_every == 0
+            try:
+                with self._db() as db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, stale_until) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (self.namespace, key, json.dumps(value), expires_at, stale_until)
+                    )
+                    if purge:
+                        # Any namespace: expired rows are dead for every reader
+                        db.execute("DELETE FROM cache WHERE stale_until < ?", (time.time(),))
+            except sqlite3.Error as e:
+                print(f"Cache write error ({self.namespace}): {e}")
+
+    async def set_async(self, key, value, negative=False):
+        if self.enabled:
+            await run_blocking(self.set, key, value, negative)
+
+    def fetch(self, key, compute):
+        """Return the cached value for ``key``, computing it on a miss.
+
+        ``compute()`` returns ``(value, cache_as)`` where ``cache_as`` is
+        "positive", "negative" or None for results that must not be cached
+        (errors, fallbacks). Stale hits are returned immediately and
+        refreshed in the background, at most one refresh per key at a time.
+        """
+        value, state = self.get(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            with self.lock:
+                start_refresh = key not in self.refreshing
+                self.refreshing.add(key)
+            if start_refresh:
+                _refresh_pool.submit(self._refresh, key, compute)
+            return value
+
+        value, cache_as = compute()
+        if cache_as:
+            self.set(key, value, negative=(cache_as == "negative"))
+        return value
+
+    async def fetch_async(self, key, compute):
+        """``fetch`` for a coroutine ``compute``. Stale hits are refreshed by a
+        task on the running event loop."""
+        value, state = await self.get_async(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            with self.lock:
+                start_refresh = key not in self.refreshing
+                self.refreshing.add(key)
+            if start_refresh:
+                task = asyncio.ensure_future(self._refresh_async(key, compute))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            return value
+
+        value, cache_as = await compute()
+        if cache_as:
+            await self.set_async(key, value, negative=(cache_as == "negative"))
+        return value
+
+    async def _refresh_async(self, key, compute):
+        try:
+            value, cache_as = await compute()
+            if cache_as:
+                await self.set_async(key, value, negative=(cache_as == "negative"))
+        except Exception as e:
+            print(f"Cache refresh error ({self.namespace}): {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _refresh(self, key, compute):
+        try:
+            value, cache_as = compute()
+            if cache_as:
+                self.set(key, value, negative=(cache_as == "negative"))
+        except Exception as e:
+            print(f"Cache refresh error ({self.namespace}): {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
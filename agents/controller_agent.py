@@ -1,29 +1,106 @@
 ﻿import os
+import re
 import json
+from collections import deque
 from datetime import datetime
+from itertools import islice
+from agents.aio import run_blocking
+from agents.tracing import span
+
+# Routing keywords for each agent, in the order agents are listed in a decision
+ROUTING_RULES = [
+    ("PDF_RAG", ["document", "pdf", "file", "uploaded", "content"]),
+    ("WEB_SEARCH", ["current", "latest", "news", "recent", "today", "now", "what is", "tell me about"]),
+    ("ARXIV", ["paper", "research", "study", "studies", "arxiv", "academic", "scientific"]),
+]
+
+
+def compile_rules(rules):
+    """Compile every agent's keywords into one regex alternation with a named
+    group per agent, so a query is scanned once however many rules there are.
+
+    Keywords must start at a word boundary but may carry a suffix, so "papers"
+    and "currently" match while "know" no longer matches "now".
+    """
+    groups = []
+    for agent, keywords in rules:
+        alternatives = "|".join(
+            re.escape(keyword).replace(r"\ ", r"\s+")
+            for keyword in sorted(keywords, key=len, reverse=True)
+        )
+        groups.append(f"(?P<{agent}>\\b(?:{alternatives}))")
+    return re.compile("|".join(groups), re.IGNORECASE)
+
+
+def gemini_executor():
+    # Imported late, like the router, so rule-based routing needs no SDK
+    from agents.gemini_client import get_gemini
+    return get_gemini().executor
+
+
+def load_default_router():
+    """Return the embedding-centroid router if trained centroids exist, else None."""
+    try:
+        from agents.semantic_router import CentroidRouter
+    except ImportError as e:
+        print(f"Warning: embedding router unavailable ({e}), using rule-based routing")
+        return None
+    router = CentroidRouter()
+    return router if router.ready else None
+
 
 class ControllerAgent:
-    def __init__(self):
-        self.logs = []
+    def __init__(self, max_logs=None, router="default"):
+        # Only the most recent decisions are kept, so memory stays flat
+        self.logs = deque(maxlen=max_logs or int(os.environ.get("CONTROLLER_LOG_SIZE", 100)))
+        self.matcher = compile_rules(ROUTING_RULES)
+        self.agent_order = [agent for agent, _ in ROUTING_RULES]
+        # Embedding-centroid router; the keyword rules remain the fallback
+        self.router = load_default_router() if router == "default" else router
     
-    def analyze_query(self, query, has_pdf=False):
-        query_lower = query.lower()
-        agents_to_use = []
-        
-        if has_pdf and any(word in query_lower for word in ["document", "pdf", "file", "uploaded", "content"]):
-            agents_to_use.append("PDF_RAG")
+    def match_agents(self, query):
+        """Return the agents whose keywords occur in ``query``, in rule order."""
+        matched = set()
+        for match in self.matcher.finditer(query):
+            matched.add(match.lastgroup)
+            if len(matched) == len(self.agent_order):
+                break
+        return [agent for agent in self.agent_order if agent in matched]
+    
+    def _router_scores(self, queries):
+        """One embedding call and one matrix product for all ``queries``; None
+        if the router is missing or fails."""
+        if self.router is None:
+            return None
+        try:
+            return self.router.scores(queries)
+        except Exception as e:
+            print(f"Warning: embedding router failed ({e}), using rule-based routing")
+            return None
+    
+    def _decide(self, query, has_pdf, scores=None):
+        rule_agents = self.match_agents(query)
         
-        if any(word in query_lower for word in ["current", "latest", "news", "recent", "today", "now", "what is", "tell me about"]):
-            agents_to_use.append("WEB_SEARCH")
+        agents_to_use = []
+        reasoning = "Rule-based routing"
+        if scores is not None:
+            selected = self.router.select(scores, rule_agents, has_pdf)
+            agents_to_use = [agent for agent in self.agent_order if agent in selected]
+            reasoning = f"Embedding-centroid routing ({self.router.describe(scores)})"
         
-        if any(word in query_lower for word in ["paper", "research", "study", "arxiv", "academic", "scientific"]):
-            agents_to_use.append("ARXIV")
+        if not agents_to_use:
+            agents_to_use = list(rule_agents)
+            # The PDF agent only applies when a document has been uploaded
+            if not has_pdf and "PDF_RAG" in agents_to_use:
+                agents_to_use.remove("PDF_RAG")
+            if scores is not None:
+                reasoning += "; no agent scored above threshold, fell back to rules"
         
         # If no specific agent matched, default to web search
         if not agents_to_use:
             agents_to_use.append("WEB_SEARCH")
         
-        decision = {"agents": agents_to_use, "reasoning": "Rule-based routing"}
+        decision = {"agents": agents_to_use, "reasoning": reasoning}
         
         log_entry = {
             "timestamp": datetime.now().isoformat(),
@@ -35,5 +112,27 @@ class ControllerAgent:
         
         return decision
     
+    def analyze_query(self, query, has_pdf=False):
+        with span("route"):
+            scores = self._router_scores([query])
+            return self._decide(query, has_pdf, scores[0] if scores is not None else None)
+    
+    async def analyze_query_async(self, query, has_pdf=False):
+        with span("route"):
+            # Scoring may embed the query, a blocking Gemini call that can
+            # wait for quota: run it on the Gemini client's threads
+            executor = gemini_executor() if self.router is not None else None
+            scores = await run_blocking(self._router_scores, [query], executor=executor)
+            return self._decide(query, has_pdf, scores[0] if scores is not None else None)
+    
+    def analyze_batch(self, queries, has_pdf=False):
+        """Route several queries at once; returns one decision per query."""
+        queries = list(queries)
+        scores = self._router_scores(queries) if queries else None
+        return [
+            self._decide(query, has_pdf, scores[i] if scores is not None else None)
+            for i, query in enumerate(queries)
+        ]
+    
     def get_logs(self):
-        return self.logs[-10:]
+        return list(islice(reversed(self.logs), 10))[::-1]
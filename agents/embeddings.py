@@ -0,0 +1,27 @@
+import numpy as np
+from agents.gemini_client import get_gemini
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
+# Gemini accepts at most 100 texts per batch embedding request
+BATCH_SIZE = 100
+
+
+def embed_texts(texts, task_type="retrieval_document"):
+    """Embed ``texts`` with Gemini and return an L2-normalized float32 matrix,
+    one row per text, ready to be added to or searched against a FAISS index."""
+    gemini = get_gemini()
+    vectors = []
+    for start in range(0, len(texts), BATCH_SIZE):
+        batch = texts[start:start + BATCH_SIZE]
+        result = gemini.embed(batch, EMBEDDING_MODEL, task_type)
+        vectors.extend(result['embedding'])
+
+    matrix = np.asarray(vectors, dtype='float32').reshape(-1, EMBEDDING_DIM)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embed_query(text):
+    return embed_texts([text], task_type="retrieval_query")
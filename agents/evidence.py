@@ -0,0 +1,64 @@
+"""
+Single-pass synthesis: agents hand back raw evidence (search hits, arXiv
+papers, PDF chunks) instead of their own LLM summaries, and one grounded
+Gemini call answers from all of it. A query then costs one LLM call
+instead of one per agent plus the synthesis.
+"""
+
+# Per-source text cap, so the prompt stays bounded however much comes back
+MAX_SOURCE_CHARS = 800
+
+
+def evidence_sources(evidence):
+    """Flatten ``{agent: AgentResult}`` whose outputs are ``SearchHit``,
+    ``Paper`` or ``Chunk`` lists into a numbered list of
+    ``{"agent", "title", "url", "text"}`` sources. Failed agents are skipped."""
+    sources = []
+    for agent_name, result in evidence.items():
+        if not result.ok or not isinstance(result.output, list):
+            continue
+        for item in result.output:
+            if agent_name == 'WEB_SEARCH':
+                source = {"title": item.title, "url": item.url, "text": item.snippet}
+            elif agent_name == 'ARXIV':
+                source = {
+                    "title": f"{item.title} ({item.authors}, {item.published})",
+                    "url": item.url,
+                    "text": item.summary,
+                }
+            elif agent_name == 'PDF_RAG':
+                source = {"title": f"{item.source} (chunk {item.chunk_id})", "url": None, "text": item.text}
+            else:
+                continue
+            source["agent"] = agent_name
+            source["text"] = source["text"][:MAX_SOURCE_CHARS]
+            sources.append(source)
+    return sources
+
+
+def format_sources(sources):
+    return "\n\n".join(
+        f"[{i}] {source['title']}" + (f" <{source['url']}>" if source['url'] else "") + f"\n{source['text']}"
+        for i, source in enumerate(sources, 1)
+    )
+
+
+def grounded_prompt(query, evidence):
+    """Return ``(prompt, sources, context)`` for answering ``query`` from
+    ``evidence`` with numbered citations."""
+    sources = evidence_sources(evidence)
+    context = format_sources(sources)
+    failures = [f"- {agent_name}: {result.error}" for agent_name, result in evidence.items() if not result.ok]
+    notes = "\n\nThese sources could not be searched:\n" + "\n".join(failures) if failures else ""
+
+    prompt = f"""Answer the user's question using the numbered sources below, which come from web search results, arXiv papers and excerpts of the user's uploaded PDFs.
+
+User Question: {query}
+
+Sources:
+{context or "(no sources were found)"}{notes}
+
+Cite sources inline as [n]. Prefer the uploaded PDFs for questions about the user's documents. If the sources do not answer the question, say so and answer from general knowledge, marking that part clearly as not sourced.
+
+Answer:"""
+    return prompt, sources, context
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+from agents.llm_cache import LLMResponseCache, CachedResponse, response_key
+from agents.aio import run_blocking
+from agents.limits import TokenBucket, Slots
+from agents.tracing import span
+from agents.metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
+
+DEFAULT_MODEL = 'gemini-2.0-flash'
+# Rough prompt-size estimate used for the token budget before Gemini
+# reports the real count
+CHARS_PER_TOKEN = 4
+# Project quotas, overridable with GEMINI_RPM and GEMINI_TPM
+DEFAULT_RPM = 60
+DEFAULT_TPM = 1000000
+
+GEMINI_CALLS = Counter("gemini_calls_total", "Gemini calls by kind and outcome (ok, error, cancelled, cached)",
+                       ("kind", "outcome"))
+GEMINI_LATENCY = Histogram("gemini_call_duration_seconds", "Time per Gemini API call, excluding quota waits",
+                           ("kind",))
+GEMINI_PROMPT_CHARS = Histogram("gemini_prompt_chars", "Characters sent per Gemini API call", ("kind",),
+                                buckets=SIZE_BUCKETS)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Tokens Gemini reported using, prompt and output")
+GEMINI_IN_FLIGHT = Gauge("gemini_calls_in_flight", "Gemini API calls under way")
+
+
+@contextmanager
+def _measured(kind, prompt_chars):
+    GEMINI_PROMPT_CHARS.observe(prompt_chars, kind=kind)
+    GEMINI_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        GEMINI_IN_FLIGHT.dec()
+        GEMINI_LATENCY.observe(time.perf_counter() - start, kind=kind)
+        GEMINI_CALLS.inc(kind=kind, outcome=outcome)
+
+
+class GeminiClient:
+    """Process-wide gateway for every Gemini call.
+
+    Configures the SDK once, keeps one model handle per model name, and
+    keeps the process inside the project's quotas: at most ``max_in_flight``
+    concurrent calls, ``rpm`` requests and ``tpm`` tokens per minute. Calls
+    over budget queue until capacity frees up rather than erroring out.
+    A limit of 0 disables it. Async callers wait for quota and slots on
+    the event loop rather than in threads. The REST transport's blocking
+    calls, made only once a slot is held, run on a pool of their own;
+    ``executor`` is a separate pool for async code that must call the
+    blocking methods (such as ``embed``), so their quota waits tie up
+    neither the loop's threads nor the transport's.
+
+    Identical generate calls are answered from an exact-match response
+    cache (see agents.llm_cache) without touching the quotas; set
+    LLM_CACHE=0 to turn it off.
+
+    GEMINI_API_ENDPOINT points the SDK at another host (such as the
+    benchmark's stand-in) over the REST transport.
+    """
+
+    def __init__(self, api_key=None, max_in_flight=None, rpm=None, tpm=None, cache=None):
+        self.api_key = api_key
+        if cache is None and os.environ.get("LLM_CACHE", "1").lower() not in ("0", "false", "no"):
+            cache = LLMResponseCache()
+        self.cache = cache
+        max_in_flight = max_in_flight or int(os.environ.get("GEMINI_MAX_IN_FLIGHT", 8))
+        rpm = rpm if rpm is not None else int(os.environ.get("GEMINI_RPM", DEFAULT_RPM))
+        tpm = tpm if tpm is not None else int(os.environ.get("GEMINI_TPM", DEFAULT_TPM))
+        self.slots = Slots(max_in_flight)
+        self.rest_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="gemini-rest")
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="gemini-callers")
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.endpoint = os.environ.get("GEMINI_API_ENDPOINT")
+        self.models = {}
+        self.configured = False
+        self.lock = threading.Lock()
+
+    def configure(self):
+        with self.lock:
+            if not self.configured:
+                api_key = self.api_key or os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not found in environment variables")
+                if self.endpoint:
+                    genai.configure(api_key=api_key, transport="rest",
+                                    client_options={"api_endpoint": self.endpoint})
+                else:
+                    genai.configure(api_key=api_key)
+                self.configured = True
+
+    def model(self, name=DEFAULT_MODEL):
+        self.configure()
+        with self.lock:
+            handle = self.models.get(name)
+            if handle is None:
+                handle = self.models[name] = genai.GenerativeModel(name)
+            return handle
+
+    def _admit(self, estimated_tokens):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    async def _admit_async(self, estimated_tokens):
+        if self.requests:
+            await self.requests.acquire_async(1)
+        if self.tokens:
+            await self.tokens.acquire_async(estimated_tokens)
+
+    def generate(self, prompt, model=DEFAULT_MODEL, use_cache=True, **kwargs):
+        """``GenerativeModel.generate_content`` under the shared limits.
+        ``kwargs`` (generation_config, safety_settings, ...) are part of the
+        cache key."""
+        key = self._cache_key(model, prompt, kwargs) if use_cache else None
+        text = self._cached(key, "generate")
+        if text is not None:
+            return CachedResponse(text)
+
+        handle = self.model(model)
+        estimated = len(prompt) // CHARS_PER_TOKEN + 1
+        with span("gemini.generate"):
+            with span("gemini.wait"):
+                self._admit(estimated)
+                self.slots.acquire()
+            try:
+                with _measured("generate", len(prompt)):
+                    response = handle.generate_content(prompt, **kwargs)
+            finally:
+                self.slots.release()
+        self._finish(key, response, estimated)
+        return response
+
+    async def generate_async(self, prompt, model=DEFAULT_MODEL, use_cache=True, **kwargs):
+        """``generate`` on the event loop, using the SDK's async API. Waiting
+        for quota or a free slot suspends the coroutine without blocking."""
+        key = self._cache_key(model, prompt, kwargs) if use_cache else None
+        # Cache reads and writes touch the disk, so they run in a thread
+        text = await run_blocking(self._cached, key, "generate") if key else None
+        if text is not None:
+            return CachedResponse(text)
+
+        handle = self.model(model)
+        estimated = len(prompt) // CHARS_PER_TOKEN + 1
+        with span("gemini.generate"):
+            with span("gemini.wait"):
+                await self._admit_async(estimated)
+                await self.slots.acquire_async()
+            try:
+                with _measured("generate", len(prompt)):
+                    if self.endpoint:
+                        # The SDK has no async client for the REST transport
+                        response = await run_blocking(handle.generate_content, prompt,
+                                                      executor=self.rest_pool, **kwargs)
+                    else:
+                        response = await handle.generate_content_async(prompt, **kwargs)
+            finally:
+                self.slots.release()
+        await run_blocking(self._finish, key, response, estimated)
+        return response
+
+    def _cache_key(self, model, prompt, settings):
+        return response_key(model, prompt, settings) if self.cache else None
+
+    def _cached(self, key, kind):
+        if not key:
+            return None
+        with span("gemini.cache"):
+            text = self.cache.get(key)
+        if text is not None:
+            GEMINI_CALLS.inc(kind=kind, outcome="cached")
+        return text
+
+    def _finish(self, key, response, estimated):
+        usage = getattr(response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', 0) if usage else 0
+        GEMINI_TOKENS.inc(total or 0)
+        if self.tokens and total:
+            # Replace the estimate with what was actually used, output included
+            self.tokens.settle(total - estimated)
+        if key:
+            try:
+                text = response.text
+            except ValueError:
+                # Blocked or empty candidates have no text to reuse
+                text = None
+            if text:
+                self.cache.put(key, text)
+
+    def generate_stream(self, prompt, model=DEFAULT_MODEL, use_cache=True, **kwargs):
+        """Yield the response text chunk by chunk as Gemini produces it.
+
+        A cached answer is yielded whole; a streamed one is cached once it
+        has completed. The in-flight slot is held until the stream ends or
+        the caller stops iterating.
+        """
+        key = self._cache_key(model, prompt, kwargs) if use_cache else None
+        text = self._cached(key, "stream")
+        if text is not None:
+            yield text
+            return
+
+        handle = self.model(model)
+        estimated = len(prompt) // CHARS_PER_TOKEN + 1
+        self._admit(estimated)
+        parts = []
+        total = 0
+        with self.slots, _measured("stream", len(prompt)):
+            for chunk in handle.generate_content(prompt, stream=True, **kwargs):
+                usage = getattr(chunk, 'usage_metadata', None)
+                total = getattr(usage, 'total_token_count', 0) or total if usage else total
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+        GEMINI_TOKENS.inc(total)
+        if self.tokens and total:
+            self.tokens.settle(total - estimated)
+        if key and parts:
+            self.cache.put(key, "".join(parts))
+
+    def embed(self, texts, model, task_type):
+        """``genai.embed_content`` for one batch under the shared limits."""
+        self.configure()
+        chars = sum(len(text) for text in texts)
+        with span("gemini.embed"):
+            with span("gemini.wait"):
+                self._admit(chars // CHARS_PER_TOKEN + 1)
+                self.slots.acquire()
+            try:
+                with _measured("embed", chars):
+                    return genai.embed_content(model=model, content=texts, task_type=task_type)
+            finally:
+                self.slots.release()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini():
+    """Return the process-wide GeminiClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
@@ -0,0 +1,139 @@
+import os
+import time
+import random
+import threading
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from agents.aio import run_blocking
+from agents.metrics import Counter, Histogram
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_METHODS = {"GET", "HEAD"}
+
+UPSTREAM_REQUESTS = Counter("upstream_requests_total",
+                            "Upstream HTTP attempts by outcome (ok, http_error, timeout, connection_error)",
+                            ("host", "outcome"))
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Time per upstream HTTP attempt", ("host",))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Upstream HTTP attempts that were retried", ("host",))
+
+
+class HTTPClient:
+    """Shared HTTP client for the agents' upstream calls.
+
+    One ``requests.Session`` keeps connections alive per host, so repeated
+    searches skip the TCP and TLS handshakes. Each host pool holds at most
+    ``pool_maxsize`` connections; callers beyond that wait for a free one
+    rather than opening more. Connection errors and 429/5xx answers to
+    idempotent requests are retried with jittered exponential backoff
+    (honouring ``Retry-After``). Read timeouts are not retried: the upstream
+    is slow, not gone, and a retry would only run into the agent deadline.
+
+    ``get_async`` runs requests on a thread pool per host, sized like the
+    host's connection pool, so a slow or throttled upstream ties up only
+    its own threads.
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, max_retries=None, backoff=None,
+                 max_backoff=None, connect_timeout=None, read_timeout=None):
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("HTTP_MAX_RETRIES", 2))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("HTTP_BACKOFF", 0.5))
+        self.max_backoff = max_backoff if max_backoff is not None else float(os.environ.get("HTTP_MAX_BACKOFF", 4))
+        self.connect_timeout = connect_timeout or float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05))
+        self.read_timeout = read_timeout or float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+
+        self.pool_maxsize = pool_maxsize or int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+        self.executors = {}
+        self.lock = threading.Lock()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or int(os.environ.get("HTTP_POOL_HOSTS", 10)),
+            pool_maxsize=self.pool_maxsize,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    async def get_async(self, url, **kwargs):
+        """``get`` for coroutines. requests has no async API, so the call
+        runs on the host's worker threads and still uses the shared pools."""
+        return await run_blocking(self.request, "GET", url, executor=self._executor(url), **kwargs)
+
+    def _executor(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            executor = self.executors.get(host)
+            if executor is None:
+                # More threads than connections would only wait for one
+                executor = self.executors[host] = ThreadPoolExecutor(
+                    max_workers=self.pool_maxsize, thread_name_prefix=f"http-{host}")
+            return executor
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """Like ``requests.request``; ``timeout`` defaults to the configured
+        ``(connect, read)`` pair. Returns the last response once retries run
+        out, so callers still see the upstream status."""
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        if retries is None:
+            retries = self.max_retries if method.upper() in RETRY_METHODS else 0
+
+        host = urlparse(url).hostname
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ReadTimeout:
+                _observe(host, start, "timeout")
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                timed_out = isinstance(e, requests.exceptions.ConnectTimeout)
+                _observe(host, start, "timeout" if timed_out else "connection_error")
+                if attempt == retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                _observe(host, start, "http_error" if response.status_code >= 400 else "ok")
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                response.close()
+            UPSTREAM_RETRIES.inc(host=host)
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        try:
+            return min(float(value), self.max_backoff) if value else None
+        except ValueError:
+            # HTTP-date form: not worth parsing for a capped wait
+            return self.max_backoff
+
+
+def _observe(host, start, outcome):
+    UPSTREAM_REQUESTS.inc(host=host, outcome=outcome)
+    UPSTREAM_LATENCY.observe(time.perf_counter() - start, host=host)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide HTTPClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
@@ -0,0 +1,48 @@
+import os
+import pickle
+import hashlib
+import threading
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionCache:
+    """Content-addressed store of what ingesting a PDF produced: the extracted
+    text, its chunks and their embeddings, keyed on the SHA-256 of the file.
+
+    A repeat upload, or a re-ingest after a restart, then costs one hash
+    instead of a full parse and embedding pass.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, digest):
+        # Fan out over subdirectories so no single directory grows huge
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.pkl")
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: ignoring unreadable ingestion cache entry {digest}: {e}")
+            return None
+
+    def put(self, digest, entry):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per thread too: ingest jobs for the same bytes may overlap
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
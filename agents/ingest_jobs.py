@@ -0,0 +1,95 @@
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion backlog is at capacity; callers should retry later."""
+
+
+def upload_path(upload_dir, filename):
+    """Where to save an upload for a background job: a fresh directory per
+    upload, so a later file with the same name cannot replace this one
+    before its job has hashed and extracted it. The file keeps its name,
+    which is what the index shows as the document's source."""
+    directory = os.path.join(upload_dir, uuid.uuid4().hex)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(filename))
+
+
+class IngestionJobQueue:
+    """Ingests uploaded PDFs on a bounded background pool so upload handlers
+    can respond as soon as the file is saved.
+
+    Each upload becomes a job whose progress (stage, pages done, chunks
+    indexed) can be polled by id. At most ``max_pending`` jobs may be queued
+    or running at once; beyond that ``submit`` raises ``JobQueueFull``.
+    """
+
+    def __init__(self, pdf_rag, max_workers=None, max_pending=None, max_jobs_kept=1000):
+        self.pdf_rag = pdf_rag
+        max_workers = max_workers or int(os.environ.get("INGEST_WORKERS", 2))
+        self.max_pending = max_pending or int(os.environ.get("INGEST_MAX_PENDING", 32))
+        self.max_jobs_kept = max_jobs_kept
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.jobs = OrderedDict()
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, pdf_path, metadata=None):
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "filename": os.path.basename(pdf_path),
+            "status": "queued",
+            "stage": "queued",
+            "pages_done": 0,
+            "pages_total": None,
+            "chunks_total": None,
+            "chunks_indexed": 0,
+            "message": None,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise JobQueueFull(f"Ingestion queue is full ({self.max_pending} jobs pending)")
+            self.pending += 1
+            self.jobs[job_id] = job
+            # Forget the oldest finished jobs so the table stays bounded
+            while len(self.jobs) > self.max_jobs_kept:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest["status"] in ("queued", "running"):
+                    break
+                del self.jobs[oldest_id]
+
+        self.pool.submit(self._run, job_id, pdf_path, metadata)
+        return dict(job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _run(self, job_id, pdf_path, metadata):
+        self._update(job_id, status="running", stage="starting")
+        try:
+            message = self.pdf_rag.ingest_pdf(
+                pdf_path, metadata=metadata,
+                progress=lambda **fields: self._update(job_id, **fields)
+            )
+            self._update(job_id, status="done", stage="done", message=message)
+        except Exception as e:
+            self._update(job_id, status="error", stage="error",
+                         message=f"Error processing PDF {os.path.basename(pdf_path)}: {str(e)}")
+        finally:
+            self._update(job_id, finished_at=datetime.now().isoformat())
+            with self.lock:
+                self.pending -= 1
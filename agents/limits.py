@@ -0,0 +1,122 @@
+"""
+Concurrency limits shared by threads and coroutines, for the Gemini
+client's quotas: a token bucket for per-minute budgets and a semaphore
+for calls in flight.
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over each minute, holding at most
+    one minute's worth. ``acquire`` waits for units instead of failing."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        with self.condition:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self.condition.wait((amount - self.tokens) / self.rate)
+
+    async def acquire_async(self, amount=1):
+        """``acquire`` for coroutines: sleeps on the event loop, not a thread."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.condition:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                delay = (amount - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+
+    def settle(self, amount):
+        """Charge (or refund, if negative) ``amount`` after the fact; the
+        balance may go below zero, delaying later callers."""
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+            self.condition.notify_all()
+
+
+class Slots:
+    """A semaphore shared by threads and coroutines. Threads block in
+    ``acquire``; coroutines await ``acquire_async`` without holding a
+    thread. Waiters of both kinds are served in arrival order, and a
+    released slot is handed straight to the next one."""
+
+    def __init__(self, limit):
+        self.free = limit
+        self.waiters = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.free and not self.waiters:
+                self.free -= 1
+                return
+            event = threading.Event()
+            self.waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self):
+        with self.lock:
+            if self.free and not self.waiters:
+                self.free -= 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                if future in self.waiters:
+                    self.waiters.remove(future)
+                    raise
+            if future.done() and not future.cancelled():
+                # Handed a slot just as we were cancelled: pass it on
+                self.release()
+            raise
+
+    def release(self):
+        with self.lock:
+            if not self.waiters:
+                self.free += 1
+                return
+            waiter = self.waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+
+    def _hand_over(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
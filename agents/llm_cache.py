@@ -0,0 +1,183 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Directory scans and eviction run here, never on a caller's thread
+_maintenance_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+
+
+def response_key(model, prompt, settings=None):
+    """SHA-256 over the model name, the prompt and the generation settings;
+    any difference in any of them is a different key."""
+    payload = json.dumps([model, prompt, settings or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CachedResponse:
+    """Stands in for a Gemini response served from the cache."""
+
+    usage_metadata = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class LLMResponseCache:
+    """Exact-match cache of generated text.
+
+    An in-memory LRU of ``memory_items`` entries sits in front of a
+    content-addressed directory of small JSON files. The directory is held
+    under ``max_bytes`` by evicting the least recently used files (reads
+    refresh a file's mtime). Hits and misses are counted per tier.
+
+    The directory size is measured once in the background and then tracked
+    as entries are written; eviction also runs in the background. ``get``
+    and ``put`` still touch the disk, so async callers run them in a thread.
+    """
+
+    def __init__(self, cache_dir=None, memory_items=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+        self.memory_items = memory_items or int(os.environ.get("LLM_CACHE_MEMORY_ITEMS", 512))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_bytes = None
+        self.evicting = False
+        if self.max_bytes:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._start_eviction()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, text):
+        with self.lock:
+            self.memory[key] = text
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached text for ``key``, or None."""
+        with self.lock:
+            text = self.memory.get(key)
+            if text is not None:
+                self.memory.move_to_end(key)
+                self.hits_memory += 1
+                return text
+
+        if self.max_bytes:
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = json.load(f)["text"]
+                os.utime(path)
+            except FileNotFoundError:
+                text = None
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: ignoring unreadable LLM cache entry {key}: {e}")
+                text = None
+            if text is not None:
+                self._remember(key, text)
+                with self.lock:
+                    self.hits_disk += 1
+                return text
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if not self.max_bytes:
+            return
+        path = self._path(key)
+        data = json.dumps({"text": text}, ensure_ascii=False).encode('utf-8')
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write LLM cache entry {key}: {e}")
+            return
+
+        with self.lock:
+            # None until the initial scan has measured the directory
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(data) - replaced
+                if self.disk_bytes > self.max_bytes:
+                    self._start_eviction()
+
+    def _start_eviction(self):
+        # Caller holds self.lock, or is __init__
+        if not self.evicting:
+            self.evicting = True
+            _maintenance_pool.submit(self._evict)
+
+    def _scan(self):
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Measure the directory and, if it is over ``max_bytes``, remove the
+        least recently used files. Runs on the maintenance thread."""
+        try:
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            if total > self.max_bytes:
+                # Trim to 90% so eviction doesn't rescan on every subsequent write
+                target = self.max_bytes * 0.9
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evicted += 1
+            with self.lock:
+                self.disk_bytes = total
+                self.evictions += evicted
+        except Exception as e:
+            print(f"Warning: LLM cache eviction failed: {e}")
+        finally:
+            with self.lock:
+                self.evicting = False
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self.memory),
+                "disk_bytes": self.disk_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,273 @@
+import os
+import gzip
+import json
+import heapq
+import threading
+from array import array
+from collections import OrderedDict
+from agents.request_log import list_segments
+from agents.orchestrator import canonical_agent_name
+
+
+class SegmentIndex:
+    """Byte offset of every complete line in one log segment.
+
+    Segments are append-only, so the index is extended from where it last
+    stopped rather than rebuilt. Gzipped and legacy JSON segments cannot be
+    seeked into; their entries are decoded once and kept instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = array('Q')
+        self.indexed_upto = 0
+        self.entries = None
+        self.mtime = None
+
+    def __len__(self):
+        return len(self.entries) if self.entries is not None else len(self.offsets)
+
+    def update(self):
+        mtime = os.path.getmtime(self.path)
+        if self.path.endswith(('.gz', '.json')):
+            if self.entries is None or mtime != self.mtime:
+                self.entries = _load_whole(self.path)
+                self.mtime = mtime
+            return
+
+        size = os.path.getsize(self.path)
+        if size < self.indexed_upto:
+            # Truncated or replaced: start over
+            self.offsets = array('Q')
+            self.indexed_upto = 0
+        if size == self.indexed_upto:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.indexed_upto)
+            position = self.indexed_upto
+            for line in f:
+                # A line without its newline is still being written
+                if not line.endswith(b"\n"):
+                    break
+                self.offsets.append(position)
+                position += len(line)
+        self.indexed_upto = position
+        self.mtime = mtime
+
+    def read(self, line_numbers):
+        """Yield ``(line_number, entry)`` for the given line numbers."""
+        if self.entries is not None:
+            for number in line_numbers:
+                yield number, self.entries[number]
+            return
+        with open(self.path, 'rb') as f:
+            for number in line_numbers:
+                f.seek(self.offsets[number])
+                try:
+                    yield number, json.loads(f.readline())
+                except json.JSONDecodeError:
+                    continue
+
+
+def _load_whole(path):
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            return json.load(f)
+    entries = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def _has_error(entry):
+    if entry.get('error'):
+        return True
+    responses = entry.get('agent_responses') or {}
+    # Agent results carry "error": null when they succeeded; entries from
+    # before agent results were records only have the key on failure
+    return any(isinstance(response, dict) and response.get('error') for response in responses.values())
+
+
+def _uses_agent(entry, agent):
+    wanted = canonical_agent_name(agent) or agent.upper()
+    return any((canonical_agent_name(used) or used.upper()) == wanted for used in entry.get('agents_used') or [])
+
+
+class RequestLogReader:
+    """Pages through request logs newest-first without loading whole files.
+
+    Each segment keeps a small in-memory offset index, so a page is read by
+    seeking to the last lines of the newest segments. What a request costs
+    depends on the page size and filters, not on how much history is on
+    disk. Segments wholly outside a time range are skipped by their date,
+    and at most ``max_scan`` entries are examined per call; a filter that
+    matches nothing recent returns a cursor to continue from instead of
+    walking the whole history.
+
+    Cursors have the form ``<segment file>:<line number>[,...]``, one pair
+    per segment of the day the page stopped in. Indexes are kept
+    for the ``max_indexes`` most recently read segments only, since gzipped
+    and legacy segments hold their decoded entries.
+    """
+
+    def __init__(self, log_dir='logs', prefix='requests', max_scan=5000, max_indexes=8):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.max_scan = max_scan
+        self.max_indexes = max_indexes
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _segments(self):
+        """Return ``(day, filename)`` for every segment, newest first; legacy
+        whole-day JSON files sort after the JSONL segments of the same day."""
+        segments = [(day, 1, seq, name) for day, seq, name in list_segments(self.log_dir, self.prefix)]
+        try:
+            names = os.listdir(self.log_dir)
+        except FileNotFoundError:
+            names = []
+        legacy_prefix = f"{self.prefix}_"
+        for name in names:
+            day = name[len(legacy_prefix):-len('.json')]
+            if name.startswith(legacy_prefix) and name.endswith('.json') and day.isdigit():
+                segments.append((day, 0, 0, name))
+        return [(day, name) for day, _, _, name in sorted(segments, reverse=True)]
+
+    def _index(self, name):
+        with self.lock:
+            index = self.indexes.get(name)
+            if index is None:
+                index = self.indexes[name] = SegmentIndex(os.path.join(self.log_dir, name))
+                while len(self.indexes) > self.max_indexes:
+                    self.indexes.popitem(last=False)
+            else:
+                self.indexes.move_to_end(name)
+            index.update()
+            return index
+
+    def page(self, limit=50, cursor=None, since=None, until=None, agent=None, has_pdf=None, error=None):
+        """Return ``(entries, next_cursor)``: up to ``limit`` matching entries,
+        newest first. ``next_cursor`` is None once history is exhausted.
+
+        Each process writes its own segments, so the segments of one day are
+        merged by timestamp. A cursor records how far into each of that day's
+        segments the previous page got; segments started after it was issued
+        only hold newer entries and are skipped.
+
+        ``since``/``until`` are ISO timestamps, or dates covering the whole
+        day; ``has_pdf`` and ``error`` are booleans or None for "either".
+        """
+        since, until = _time_bounds(since, until)
+        since_day = since[:10].replace('-', '') if since else None
+        until_day = until[:10].replace('-', '') if until else None
+
+        days = OrderedDict()
+        for day, name in self._segments():
+            days.setdefault(day, []).append(name)
+        days = list(days.items())
+
+        positions = None
+        if cursor:
+            names = {name for _, day_names in days for name in day_names}
+            positions = {}
+            for part in cursor.split(','):
+                name, _, line = part.rpartition(':')
+                if name not in names and name + '.gz' in names:
+                    # The segment was compressed since the cursor was issued
+                    name += '.gz'
+                positions[name] = int(line)
+            cursor_days = [i for i, (_, day_names) in enumerate(days) if positions.keys() & set(day_names)]
+            if not cursor_days:
+                return [], None
+            days = days[cursor_days[0]:]
+
+        entries = []
+        scanned = 0
+        for i, (day, day_names) in enumerate(days):
+            if until_day and day > until_day:
+                continue
+            if since_day and day < since_day:
+                break
+
+            starts = {}
+            readers = []
+            for name in day_names:
+                if positions is not None and i == 0 and name not in positions:
+                    continue
+                try:
+                    index = self._index(name)
+                except OSError:
+                    continue
+                start = len(index)
+                if positions is not None and i == 0:
+                    start = min(start, positions[name])
+                starts[name] = start
+                readers.append(_newest_first(name, index, start))
+
+            for timestamp, name, number, entry in heapq.merge(*readers, reverse=True):
+                starts[name] = number
+                scanned += 1
+                if until and timestamp > until:
+                    pass
+                elif since and timestamp < since:
+                    # Merged newest-first: nothing older can match
+                    return entries, None
+                elif (agent is None or _uses_agent(entry, agent)) \
+                        and (has_pdf is None or bool(entry.get('has_pdf')) == has_pdf) \
+                        and (error is None or _has_error(entry) == error):
+                    entries.append(entry)
+
+                if len(entries) >= limit or scanned >= self.max_scan:
+                    more = any(starts.values()) or i < len(days) - 1
+                    return entries, ",".join(f"{name}:{line}" for name, line in starts.items()) if more else None
+
+        return entries, None
+
+
+def _time_bounds(since, until):
+    """Widen a bare date (YYYY-MM-DD) to the start or end of that day, so it
+    compares correctly against full timestamps."""
+    if since and len(since) == 10:
+        since += "T00:00:00"
+    if until and len(until) == 10:
+        until += "T23:59:59.999999"
+    return since, until
+
+
+def _newest_first(name, index, start):
+    """``(timestamp, segment, line, entry)`` for the lines of one segment
+    before ``start``, last first, ready for ``heapq.merge``."""
+    for number, entry in index.read(range(start - 1, -1, -1)):
+        yield str(entry.get('timestamp', '')), name, number, entry
+
+
+def _parse_bool(value):
+    if value is None or value == '':
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Expected true or false, got '{value}'")
+
+
+def page_args(args, max_limit=500):
+    """Turn /logs query parameters into keyword arguments for
+    ``RequestLogReader.page``. Raises ValueError on malformed input."""
+    cursor = args.get('cursor') or None
+    if cursor and not all(part.rpartition(':')[0] and part.rpartition(':')[2].isdigit()
+                          for part in cursor.split(',')):
+        raise ValueError(f"Malformed cursor '{cursor}'")
+    return {
+        "limit": max(1, min(int(args.get('limit', 50)), max_limit)),
+        "cursor": cursor,
+        "since": args.get('since') or None,
+        "until": args.get('until') or None,
+        "agent": args.get('agent') or None,
+        "has_pdf": _parse_bool(args.get('has_pdf')),
+        "error": _parse_bool(args.get('error')),
+    }
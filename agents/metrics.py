@@ -0,0 +1,231 @@
+"""
+Process-wide metrics in the Prometheus text exposition format.
+
+Modules declare their counters, gauges and histograms at import time and
+update them as they work; ``instrument(app)`` adds per-route request
+metrics and a ``/metrics`` endpoint to a Flask app. State that already
+lives elsewhere (the document store, the admission queue, the LLM cache)
+is read when /metrics is scraped rather than mirrored on every change.
+
+Metrics are per process: with several worker processes, scrape each one.
+"""
+
+import time
+import threading
+
+# Seconds; wide enough for a cached lookup and a slow Gemini call alike
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+# Characters, for prompt sizes
+SIZE_BUCKETS = (256, 1024, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _render(name, kind, help, samples):
+    """``samples`` are ``(sample_name, [(label, value), ...], value)``."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        if not self.labelnames and self.kind != "histogram":
+            # Unlabelled series start at zero rather than missing
+            self.values[()] = 0
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in items]
+
+    def render(self):
+        return _render(self.name, self.kind, self.help, self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            buckets, count, total = self.values.get(key) or ([0] * len(self.buckets), 0, 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self.values[key] = (buckets, count + 1, total + value)
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, (list(buckets), count, total)) for key, (buckets, count, total) in self.values.items())
+        samples = []
+        for key, (buckets, count, total) in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, observed in zip(self.buckets, buckets):
+                samples.append((f"{self.name}_bucket", labels + [("le", _format_value(bound))], observed))
+            samples.append((f"{self.name}_bucket", labels + [("le", "+Inf")], count))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+def render(state=None):
+    """Every registered metric, plus gauges for ``state`` (see
+    ``state_samples``), as exposition text."""
+    with _lock:
+        metrics = list(_metrics)
+    blocks = [metric.render() for metric in metrics]
+    for name, kind, help, samples in state_samples(state or {}):
+        blocks.append(_render(name, kind, help, samples))
+    return "\n".join(blocks) + "\n"
+
+
+def state_samples(state):
+    """Read-at-scrape metrics from the app's objects: ``pdf_rag``,
+    ``admission`` and ``llm_cache`` (each optional)."""
+    pdf_rag = state.get("pdf_rag")
+    if pdf_rag is not None and hasattr(pdf_rag, "documents"):
+        index = getattr(pdf_rag, "index", None)
+        yield ("rag_documents", "gauge", "PDF documents in the document store",
+               [("rag_documents", [], len(pdf_rag.documents))])
+        yield ("rag_chunks", "gauge", "Chunks in the vector index",
+               [("rag_chunks", [], getattr(index, "ntotal", 0))])
+
+    admission = state.get("admission")
+    if admission is not None:
+        stats = admission.stats()
+        yield ("ask_active_requests", "gauge", "Admitted /ask requests being served",
+               [("ask_active_requests", [], stats["active"])])
+        yield ("ask_queue_depth", "gauge", "Requests waiting for an /ask slot",
+               [("ask_queue_depth", [], stats["queue_depth"])])
+        yield ("ask_admitted_total", "counter", "Requests admitted to /ask",
+               [("ask_admitted_total", [], stats["admitted"])])
+        yield ("ask_rejected_total", "counter", "Requests rejected by admission control",
+               [("ask_rejected_total", [("reason", reason)], count)
+                for reason, count in sorted(stats["rejected"].items())])
+        yield ("ask_queue_wait_seconds_avg", "gauge", "Smoothed time spent queueing for /ask",
+               [("ask_queue_wait_seconds_avg", [], stats["avg_wait_ms"] / 1000)])
+
+    llm_cache = state.get("llm_cache")
+    if llm_cache is not None:
+        stats = llm_cache.stats()
+        yield ("llm_cache_hits_total", "counter", "LLM response cache hits",
+               [("llm_cache_hits_total", [("tier", "memory")], stats["hits_memory"]),
+                ("llm_cache_hits_total", [("tier", "disk")], stats["hits_disk"])])
+        yield ("llm_cache_misses_total", "counter", "LLM response cache misses",
+               [("llm_cache_misses_total", [], stats["misses"])])
+        yield ("llm_cache_evictions_total", "counter", "LLM response cache files evicted",
+               [("llm_cache_evictions_total", [], stats["evictions"])])
+        if stats["disk_bytes"] is not None:
+            # None without a disk tier, or until the first scan has measured it
+            yield ("llm_cache_disk_bytes", "gauge", "Size of the LLM response cache on disk",
+                   [("llm_cache_disk_bytes", [], stats["disk_bytes"])])
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to produce an HTTP response", ("route", "method"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled", ("route",))
+
+
+def instrument(app, state=None):
+    """Record request metrics for every route of the Flask ``app`` and
+    serve them at /metrics. ``state`` is a zero-argument callable returning
+    the objects ``state_samples`` reads, looked up on each scrape.
+
+    Streamed responses are timed until the handler returns, not until the
+    stream ends."""
+    from flask import Response, g, request
+
+    def route():
+        # The rule, not the path, so /jobs/<job_id> is one series
+        return request.url_rule.rule if request.url_rule else "unmatched"
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route=route())
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            HTTP_REQUESTS.inc(route=route(), method=request.method, status=response.status_code)
+            HTTP_LATENCY.observe(time.perf_counter() - start, route=route(), method=request.method)
+            HTTP_IN_FLIGHT.dec(route=route())
+        return response
+
+    @app.teardown_request
+    def record_failure(error):
+        # Unhandled exceptions skip after_request
+        if g.pop("metrics_start", None) is not None:
+            HTTP_REQUESTS.inc(route=route(), method=request.method, status=500)
+            HTTP_IN_FLIGHT.dec(route=route())
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(state() if state else None), content_type=CONTENT_TYPE)
+
+    return app
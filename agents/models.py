@@ -0,0 +1,108 @@
+"""
+Slotted record types passed between the agents and the apps.
+
+Agents hand these objects around instead of pre-formatted strings or ad hoc
+dicts; text and JSON are produced once, at the edge, from ``to_dict``.
+``__slots__`` keeps each instance small and attribute access fast, which
+matters for the thousands of chunks and hits a busy process holds.
+"""
+
+
+class Record:
+    __slots__ = ()
+
+    def to_dict(self):
+        return {name: to_jsonable(getattr(self, name)) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class SearchHit(Record):
+    """One DuckDuckGo result."""
+    __slots__ = ('title', 'snippet', 'url')
+
+    def __init__(self, title, snippet, url):
+        self.title = title
+        self.snippet = snippet
+        self.url = url
+
+
+class Paper(Record):
+    """One arXiv paper; ``id`` is the arXiv id including its version."""
+    __slots__ = ('id', 'title', 'authors', 'summary', 'published', 'url')
+
+    def __init__(self, id, title, authors, summary, published, url):
+        self.id = id
+        self.title = title
+        self.authors = authors
+        self.summary = summary
+        self.published = published
+        self.url = url
+
+
+class Chunk(Record):
+    """A retrieved PDF chunk; ``score`` is its L2 distance to the query."""
+    __slots__ = ('id', 'source', 'chunk_id', 'text', 'metadata', 'score')
+
+    def __init__(self, id, source, chunk_id, text, metadata=None, score=None):
+        self.id = id
+        self.source = source
+        self.chunk_id = chunk_id
+        self.text = text
+        self.metadata = metadata or {}
+        self.score = score
+
+
+class Timing(Record):
+    """How long one stage of a request took, relative to the request start.
+    ``track`` names the agent the stage ran for, if any."""
+    __slots__ = ('name', 'start_ms', 'duration_ms', 'track')
+
+    def __init__(self, name, start_ms, duration_ms, track=None):
+        self.name = name
+        self.start_ms = start_ms
+        self.duration_ms = duration_ms
+        self.track = track
+
+
+class AgentResult(Record):
+    """What one agent produced for one query.
+
+    ``output`` is the agent's answer text, or a list of evidence records
+    (``SearchHit``, ``Paper``, ``Chunk``) in single-pass mode. A failed or
+    timed-out agent has ``output`` None and ``error`` set.
+    """
+    __slots__ = ('agent', 'output', 'error', 'timed_out', 'duration_ms')
+
+    def __init__(self, agent, output=None, error=None, timed_out=False, duration_ms=None):
+        self.agent = agent
+        self.output = output
+        self.error = error
+        self.timed_out = timed_out
+        self.duration_ms = duration_ms
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def to_jsonable(value):
+    """Turn records (and containers of them) into plain JSON types."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    return value
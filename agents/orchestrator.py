@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import inspect
+import contextvars
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from agents.models import AgentResult
+from agents.aio import run_sync
+from agents.tracing import span
+from agents.metrics import Counter, Histogram
+
+# Per-agent deadlines in seconds. Each can be overridden with an environment
+# variable such as AGENT_TIMEOUT_WEB_SEARCH=15.
+DEFAULT_AGENT_TIMEOUTS = {
+    "PDF_RAG": 30,
+    "WEB_SEARCH": 20,
+    "ARXIV": 25,
+}
+DEFAULT_TIMEOUT = 30
+
+AGENT_LATENCY = Histogram("agent_duration_seconds", "Time each agent took, timeouts included", ("agent",))
+AGENT_RESULTS = Counter("agent_results_total", "Agent runs by outcome (ok, error, timeout)", ("agent", "outcome"))
+
+
+class AgentExecutor:
+    """Fans the agents chosen by the controller out onto a shared thread pool.
+
+    Every agent runs concurrently with its own deadline, so a query costs
+    roughly the slowest agent instead of the sum of all of them.
+    """
+
+    def __init__(self, max_workers=None, timeouts=None):
+        self.max_workers = max_workers or int(os.environ.get("AGENT_MAX_WORKERS", 16))
+        self.timeouts = dict(DEFAULT_AGENT_TIMEOUTS)
+        for agent_name in self.timeouts:
+            env_value = os.environ.get(f"AGENT_TIMEOUT_{agent_name}")
+            if env_value:
+                self.timeouts[agent_name] = float(env_value)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent")
+
+    def timeout_for(self, agent_name):
+        return self.timeouts.get(agent_name, DEFAULT_TIMEOUT)
+
+    def run(self, calls):
+        """Run ``calls`` (agent name -> zero-argument callable) in parallel.
+
+        Returns an ``AgentResult`` per agent, in the order of ``calls``. An
+        agent that raises gets ``error`` set; one that misses its deadline is
+        cancelled if it has not started yet, otherwise dropped, and reported
+        with ``timed_out`` True.
+        """
+        results = dict(self.iter_run(calls))
+        return {name: results[name] for name in calls}
+
+    def iter_run(self, calls):
+        """Like ``run``, but yield ``(name, AgentResult)`` pairs as each agent
+        finishes (or times out), for callers that stream partial results."""
+        for name, result in self._iter_run(calls):
+            _observe(result)
+            yield name, result
+
+    def _iter_run(self, calls):
+        start = time.monotonic()
+        # Each agent thread gets a copy of the caller's context, trace included
+        futures = {self.pool.submit(contextvars.copy_context().run, _timed, fn, name): name
+                   for name, fn in calls.items()}
+        deadlines = {future: start + self.timeout_for(name) for future, name in futures.items()}
+
+        pending = set(futures)
+        while pending:
+            wait_for = max(0, min(deadlines[future] for future in pending) - time.monotonic())
+            done, pending = concurrent.futures.wait(pending, timeout=wait_for,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    output, duration_ms = future.result()
+                    yield name, AgentResult(name, output=output, duration_ms=duration_ms)
+                except Exception as e:
+                    yield name, AgentResult(name, error=str(e), duration_ms=_elapsed_ms(start))
+
+            now = time.monotonic()
+            for future in [future for future in pending if deadlines[future] <= now]:
+                pending.discard(future)
+                future.cancel()
+                name = futures[future]
+                timeout = self.timeout_for(name)
+                yield name, AgentResult(name, error=f"{name} timed out after {timeout:g}s", timed_out=True,
+                                        duration_ms=_elapsed_ms(start))
+
+    async def run_async(self, calls):
+        """``run`` on the event loop: coroutine functions are awaited directly,
+        plain callables run on the thread pool. Each agent gets its own
+        deadline; a late one is cancelled."""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        async def invoke(fn):
+            if inspect.iscoroutinefunction(fn):
+                output = fn()
+            else:
+                output = await loop.run_in_executor(self.pool, contextvars.copy_context().run, fn)
+            if inspect.isawaitable(output):
+                # A plain callable (a lambda, say) that returned a coroutine
+                output = await output
+            return output
+
+        async def call(name, fn):
+            timeout = self.timeout_for(name)
+            with span(f"agent.{name}", track=name):
+                try:
+                    output = await asyncio.wait_for(invoke(fn), timeout)
+                    return AgentResult(name, output=output, duration_ms=_elapsed_ms(start))
+                except asyncio.TimeoutError:
+                    return AgentResult(name, error=f"{name} timed out after {timeout:g}s", timed_out=True,
+                                       duration_ms=_elapsed_ms(start))
+                except Exception as e:
+                    return AgentResult(name, error=str(e), duration_ms=_elapsed_ms(start))
+
+        results = await asyncio.gather(*(call(name, fn) for name, fn in calls.items()))
+        for result in results:
+            _observe(result)
+        return dict(zip(calls, results))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _observe(result):
+    outcome = "timeout" if result.timed_out else "ok" if result.ok else "error"
+    AGENT_RESULTS.inc(agent=result.agent, outcome=outcome)
+    if result.duration_ms is not None:
+        AGENT_LATENCY.observe(result.duration_ms / 1000, agent=result.agent)
+
+
+def _elapsed_ms(start):
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+def _timed(fn, name):
+    start = time.monotonic()
+    with span(f"agent.{name}", track=name):
+        output = fn()
+        if inspect.iscoroutine(output):
+            # An async agent method handed to the thread-pool path
+            output = run_sync(output)
+    return output, _elapsed_ms(start)
+
+
+def canonical_agent_name(agent_name):
+    """Map the loose names some routers return ("web", "research", "rag") onto
+    the controller's canonical agent names."""
+    name = agent_name.lower()
+    if name in ['web', 'web_search'] or 'web' in name:
+        return "WEB_SEARCH"
+    if name in ['arxiv', 'research'] or 'arxiv' in name:
+        return "ARXIV"
+    if name in ['pdf', 'rag'] or 'pdf' in name:
+        return "PDF_RAG"
+    return None
@@ -0,0 +1,150 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# PDFs with more pages than this are split into page ranges parsed in a
+# process pool; smaller ones are cheaper to parse inline than to ship out
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get("PDF_PARALLEL_PAGE_THRESHOLD", 64))
+PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 32))
+DEFAULT_BACKEND = os.environ.get("PDF_EXTRACT_BACKEND", "pymupdf")
+
+
+class PyPDF2Extractor:
+    """Pure-Python extraction. Slow, but tolerant of files MuPDF rejects."""
+    name = "pypdf2"
+
+    def page_count(self, pdf_path):
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+    def extract_range(self, pdf_path, start, stop):
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [(pdf_reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+
+class PyMuPDFExtractor:
+    """MuPDF-based extraction (``fitz``), falling back to PyPDF2 for any page
+    MuPDF fails on."""
+    name = "pymupdf"
+
+    def page_count(self, pdf_path):
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+
+    def extract_range(self, pdf_path, start, stop):
+        import fitz
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception:
+            return PyPDF2Extractor().extract_range(pdf_path, start, stop)
+
+        texts = []
+        fallback_reader = None
+        with doc:
+            for number in range(start, stop):
+                try:
+                    texts.append(doc[number].get_text())
+                except Exception:
+                    if fallback_reader is None:
+                        import PyPDF2
+                        fallback_reader = PyPDF2.PdfReader(pdf_path)
+                    texts.append(fallback_reader.pages[number].extract_text() or "")
+        return texts
+
+
+EXTRACTORS = {
+    PyMuPDFExtractor.name: PyMuPDFExtractor,
+    PyPDF2Extractor.name: PyPDF2Extractor,
+}
+
+
+def get_extractor(name=None):
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown PDF extraction backend '{name}'. Choose from: {', '.join(EXTRACTORS)}")
+    if name == PyMuPDFExtractor.name:
+        try:
+            import fitz  # noqa: F401
+        except ImportError:
+            print("Warning: PyMuPDF is not installed, falling back to PyPDF2 extraction")
+            name = PyPDF2Extractor.name
+    return EXTRACTORS[name]()
+
+
+def _extract_range(backend_name, pdf_path, start, stop):
+    # Runs in a pool worker, so it takes the backend by name rather than by object
+    return EXTRACTORS[backend_name]().extract_range(pdf_path, start, stop)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = int(os.environ.get("PDF_EXTRACT_WORKERS", 0)) or os.cpu_count()
+            # The servers are threaded: forking while another thread holds a
+            # lock (logging, SQLite, the Gemini client) can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def extract_pages(pdf_path, backend=None, progress=None, parallel=True):
+    """Return the text of every page of ``pdf_path``.
+
+    Large files are split into ``PAGES_PER_TASK``-page ranges parsed across all
+    cores; if the pool is unavailable, ranges are parsed inline instead.
+    Pass ``parallel=False`` when already running inside a worker process.
+    ``progress(pages_done, pages_total)`` is called as ranges complete.
+    """
+    extractor = get_extractor(backend)
+    try:
+        total_pages = extractor.page_count(pdf_path)
+    except Exception:
+        # MuPDF could not even open the file; let PyPDF2 try
+        extractor = PyPDF2Extractor()
+        total_pages = extractor.page_count(pdf_path)
+
+    if progress:
+        progress(0, total_pages)
+
+    if not parallel or total_pages <= PARALLEL_PAGE_THRESHOLD:
+        pages = extractor.extract_range(pdf_path, 0, total_pages)
+        if progress:
+            progress(total_pages, total_pages)
+        return pages
+
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages))
+              for start in range(0, total_pages, PAGES_PER_TASK)]
+    results = {}
+    try:
+        pool = _get_pool()
+        futures = {pool.submit(_extract_range, extractor.name, pdf_path, start, stop): start
+                   for start, stop in ranges}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(sum(len(texts) for texts in results.values()), total_pages)
+    except Exception as e:
+        print(f"Warning: parallel PDF extraction failed ({e}), extracting inline")
+        for start, stop in ranges:
+            if start not in results:
+                results[start] = extractor.extract_range(pdf_path, start, stop)
+                if progress:
+                    progress(sum(len(texts) for texts in results.values()), total_pages)
+
+    pages = []
+    for start, _ in ranges:
+        pages.extend(results[start])
+    return pages
+
+
+def extract_text(pdf_path, backend=None, progress=None, parallel=True):
+    return "\n".join(extract_pages(pdf_path, backend, progress, parallel))
@@ -1,34 +1,421 @@
 ﻿import os
-import google.generativeai as genai
-import PyPDF2
+import json
+import pickle
+import threading
+from contextlib import contextmanager
+import faiss
 from io import BytesIO
+from agents.embeddings import EMBEDDING_DIM, embed_texts, embed_query
+from agents.ingest_cache import IngestionCache, file_sha256
+from agents.pdf_extract import extract_pages
+from agents.gemini_client import get_gemini
+from agents.models import Chunk
+from agents.aio import run_sync, run_blocking
+from agents.singleflight import SingleFlight
+from agents.tracing import span
+from agents.cache import normalize_query
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Open persisted indexes memory-mapped and read-only: the OS pages vectors in
+# on demand and shares them between every worker process using the same file.
+# IO_FLAG_MMAP_IFC (faiss >= 1.8) is what maps the codes of flat indexes.
+# Generated data lives under index/ (git-ignored), never next to the sources
+DEFAULT_INDEX_PATH = os.environ.get("RAG_INDEX_PATH", os.path.join("index", "rag_index"))
+
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def chunk_text(text, chunk_size=500, overlap=50):
+    """Split text into chunks of ``chunk_size`` words, each sharing ``overlap``
+    words with the previous one so answers spanning a boundary are not lost."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def prepare_document(pdf_path, digest, cache, chunk_size=500, chunk_overlap=50, extract_backend=None,
+                     progress=None, parallel=True):
+    """Extract, chunk and embed one PDF, or serve it from ``cache`` when these
+    bytes were processed before. Returns ``(chunks, vectors, text_length, pages)``.
+
+    This does not touch any index, so it can run in a worker process.
+    """
+    progress = progress or (lambda **fields: None)
+    entry = cache.get(digest)
+    if entry and entry["chunk_size"] == chunk_size and entry["chunk_overlap"] == chunk_overlap:
+        pages = entry.get("pages", 0)
+        progress(stage="cached", pages_done=pages, pages_total=pages)
+        return entry["chunks"], entry["vectors"], len(entry["text"]), pages
+    
+    if entry:
+        # Same file, different chunking: reuse the text, skip the parse
+        text_content = entry["text"]
+        pages = entry.get("pages", 0)
+    else:
+        # Extract text from PDF
+        progress(stage="extracting")
+        page_texts = extract_pages(
+            pdf_path, extract_backend, parallel=parallel,
+            progress=lambda done, total: progress(pages_done=done, pages_total=total)
+        )
+        text_content = "\n".join(page_texts)
+        pages = len(page_texts)
+    
+    # Split into overlapping chunks and embed them
+    chunks = chunk_text(text_content, chunk_size, chunk_overlap)
+    progress(stage="embedding", chunks_total=len(chunks))
+    vectors = embed_texts(chunks) if chunks else None
+    cache.put(digest, {
+        "text": text_content,
+        "pages": pages,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunks": chunks,
+        "vectors": vectors
+    })
+    return chunks, vectors, len(text_content), pages
+
+
+def _store_record(document, first_id, texts):
+    """One chunk store line: a document and the text of its chunks, which
+    are vectors ``first_id`` onwards in the index."""
+    return {"document": document, "first_id": first_id, "chunks": texts}
+
+
+def _store_line(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def _chunk_records(record):
+    document = record["document"]
+    return [{
+        "id": record["first_id"] + chunk_id,
+        "source": document["filename"],
+        "chunk_id": chunk_id,
+        "text": text,
+        "metadata": document.get("metadata") or {}
+    } for chunk_id, text in enumerate(record["chunks"])]
+
 
 class PDFRAGAgent:
-    def __init__(self, index_path="rag_index"):
+    def __init__(self, index_path=DEFAULT_INDEX_PATH, chunk_size=500, chunk_overlap=50, top_k=5, read_only=None,
+                 cache_dir=None, extract_backend=None, gemini=None):
+        self.index_path = index_path
+        self.gemini = gemini or get_gemini()
         self.documents = []
-        self.pdf_contents = {}
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.top_k = top_k
+        if read_only is None:
+            read_only = os.environ.get("RAG_INDEX_READ_ONLY", "").lower() in ("1", "true", "yes")
+        self.read_only = read_only
+        # PDF text extraction backend, see agents.pdf_extract (default: PyMuPDF)
+        self.extract_backend = extract_backend
+        # Vectors live in a FAISS index; self.chunks holds the text and source
+        # of each vector, by position in the index. On disk the chunks are an
+        # append-only JSONL file, one line per document, so adding a document
+        # rewrites the index but not the text of every earlier one
+        self.index = faiss.IndexFlatL2(EMBEDDING_DIM)
+        self.chunks = []
+        # Bytes of the chunk store that match the loaded index; None until a
+        # JSONL store has been read or written
+        self.store_size = None
+        # SHA-256 of every indexed file, so the same bytes are never indexed twice
+        self.hashes = set()
+        self.cache = IngestionCache(cache_dir or os.environ.get("RAG_CACHE_DIR", f"{index_path}_cache"))
+        self.mmapped = False
+        self.loaded_mtime = None
+        # mtime of an index that failed to load, so it is not retried until it changes
+        self.failed_mtime = None
+        self.lock = threading.Lock()
+        # Identical questions against the same document set share one answer
+        self.flights = SingleFlight()
+        self.load()
+    
+    @property
+    def version(self):
+        """Changes whenever documents are added or a new index is loaded."""
+        return f"{len(self.documents)}:{self.index.ntotal}:{self.loaded_mtime}"
+    
+    @property
+    def index_file(self):
+        return f"{self.index_path}.faiss"
+    
+    @property
+    def store_file(self):
+        return f"{self.index_path}.chunks.jsonl"
+    
+    @property
+    def legacy_store_file(self):
+        # Whole-store pickle written by earlier versions; read, never written
+        return f"{self.index_path}.pkl"
+    
+    def _disk_mtime(self):
+        try:
+            return os.path.getmtime(self.index_file)
+        except OSError:
+            return None
+    
+    def load(self):
+        """Load the index persisted under ``index_path`` (memory-mapped) together
+        with its chunk store. Returns False and keeps the current state when
+        there is nothing usable on disk."""
+        mtime = self._disk_mtime()
+        if mtime is None:
+            return False
+        if not os.path.exists(self.store_file) and not os.path.exists(self.legacy_store_file):
+            return False
         
-    def add_pdf(self, pdf_path):
         try:
-            filename = os.path.basename(pdf_path)
-            
-            # Extract text from PDF
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text_content = ""
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n"
-            
-            # Store the content
-            self.pdf_contents[filename] = text_content
-            self.documents.append({"filename": filename, "path": pdf_path})
-            
-            return f"Successfully processed PDF: {filename} ({len(text_content)} characters extracted)"
-            
+            index = faiss.read_index(self.index_file, MMAP_FLAGS)
+            if index.d != EMBEDDING_DIM:
+                raise ValueError(f"index has dimension {index.d}, expected {EMBEDDING_DIM}")
+            if os.path.exists(self.store_file):
+                store = self._read_store(index.ntotal)
+            else:
+                store = self._read_legacy_store(index.ntotal)
+            # The store is written before the index, so a reader racing a
+            # writer can briefly see the two out of step; keep the previous
+            # state until they match again (the writer's rename changes the mtime)
+            if store is None:
+                self.failed_mtime = mtime
+                return False
         except Exception as e:
-            return f"Error processing PDF {filename}: {str(e)}"
+            print(f"Warning: could not load RAG index {self.index_file}: {e}")
+            self.failed_mtime = mtime
+            return False
+        
+        self.index = index
+        self.documents, self.chunks, self.store_size = store
+        self.hashes = {doc["sha256"] for doc in self.documents if doc.get("sha256")}
+        self.mmapped = True
+        self.loaded_mtime = mtime
+        self.failed_mtime = None
+        return True
+    
+    def _read_store(self, ntotal):
+        """Return ``(documents, chunks, size)`` for the first ``ntotal``
+        vectors, or None if the store does not hold that many yet. Lines
+        past what the index covers (a writer between its two steps, or one
+        that died there) are left out of ``size``. Only lines after what is
+        already loaded are read, unless the file has shrunk."""
+        documents, chunks, size = self.documents, self.chunks, self.store_size
+        if size is None or len(chunks) > ntotal or os.path.getsize(self.store_file) < size:
+            documents, chunks, size = [], [], 0
+        else:
+            documents, chunks = list(documents), list(chunks)
+        with open(self.store_file, 'rb') as f:
+            f.seek(size)
+            for line in f:
+                # A line without its newline is still being written
+                if len(chunks) >= ntotal or not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                if record["first_id"] != len(chunks):
+                    raise ValueError(f"chunk store {self.store_file} is out of order at vector {len(chunks)}")
+                if record["first_id"] + len(record["chunks"]) > ntotal:
+                    break
+                documents.append(record["document"])
+                chunks.extend(_chunk_records(record))
+                size += len(line)
+        if len(chunks) != ntotal:
+            return None
+        return documents, chunks, size
+    
+    def _read_legacy_store(self, ntotal):
+        with open(self.legacy_store_file, 'rb') as f:
+            store = pickle.load(f)
+        if store.get("ntotal") != ntotal:
+            return None
+        # No JSONL store yet: the next write creates it in full
+        return store["documents"], store["chunks"], None
+    
+    def refresh(self):
+        """Pick up documents appended to the on-disk index by another process."""
+        mtime = self._disk_mtime()
+        if mtime is not None and mtime not in (self.loaded_mtime, self.failed_mtime):
+            with self.lock:
+                self.load()
+    
+    @contextmanager
+    def _write_lock(self):
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.index_path}.lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _prepare_for_write(self):
+        # Another process may have appended since we last loaded
+        if self._disk_mtime() != self.loaded_mtime:
+            self.load()
+        # A memory-mapped index is read-only; appending needs a private copy
+        if self.mmapped:
+            self.index = faiss.read_index(self.index_file)
+            self.mmapped = False
+    
+    def _save(self, records):
+        """Persist after appending ``records`` (see ``_store_record``) to the
+        in-memory state: their chunk store lines first, then the index, so
+        readers never see vectors without their text."""
+        if self.store_size is None or not os.path.exists(self.store_file):
+            # First write, or migrating a legacy pickle store: write it all
+            everything = b"".join(_store_line(record) for record in self._store_records())
+            with open(self.store_file + '.tmp', 'wb') as f:
+                f.write(everything)
+            os.replace(self.store_file + '.tmp', self.store_file)
+            self.store_size = len(everything)
+        else:
+            lines = b"".join(_store_line(record) for record in records)
+            with open(self.store_file, 'r+b') as f:
+                # Drop lines a writer appended but never indexed
+                f.truncate(self.store_size)
+                f.seek(self.store_size)
+                f.write(lines)
+            self.store_size += len(lines)
+        
+        faiss.write_index(self.index, self.index_file + '.tmp')
+        os.replace(self.index_file + '.tmp', self.index_file)
+        self.loaded_mtime = self._disk_mtime()
+        
+    def add_pdf(self, pdf_path, metadata=None, progress=None):
+        try:
+            return self.ingest_pdf(pdf_path, metadata=metadata, progress=progress)
+        except Exception as e:
+            return f"Error processing PDF {os.path.basename(pdf_path)}: {str(e)}"
+    
+    def ingest_pdf(self, pdf_path, metadata=None, progress=None):
+        """Extract, chunk, embed and index one PDF, raising on failure.
+        
+        ``progress(**fields)``, if given, receives the stage and the page and
+        chunk counts as ingestion advances. The document only becomes visible
+        in ``self.documents`` once all of its chunks are indexed.
+        """
+        progress = progress or (lambda **fields: None)
+        filename = os.path.basename(pdf_path)
+        if self.read_only:
+            raise PermissionError(f"index {self.index_path} is opened read-only")
+        
+        # Identical bytes are only ever indexed once
+        digest = file_sha256(pdf_path)
+        if digest in self.hashes:
+            return f"PDF already indexed: {filename} (identical content was uploaded before)"
+        
+        chunks, vectors, text_length, _ = prepare_document(
+            pdf_path, digest, self.cache, self.chunk_size, self.chunk_overlap,
+            self.extract_backend, progress
+        )
+        if not chunks:
+            return f"No text could be extracted from PDF: {filename}"
+        
+        progress(stage="indexing", chunks_total=len(chunks))
+        added = self.add_documents([{
+            "filename": filename,
+            "path": pdf_path,
+            "sha256": digest,
+            "chunks": chunks,
+            "vectors": vectors,
+            "metadata": metadata
+        }])
+        if not added[0]:
+            # A concurrent upload of the same file won the race
+            return f"PDF already indexed: {filename} (identical content was uploaded before)"
+        progress(chunks_indexed=len(chunks))
+        
+        return f"Successfully processed PDF: {filename} ({text_length} characters extracted, {len(chunks)} chunks indexed)"
+    
+    def add_documents(self, documents):
+        """Append already chunked and embedded documents to the index and
+        persist it once for the whole batch.
+        
+        Each document is a dict with ``filename``, ``path``, ``sha256``,
+        ``chunks``, ``vectors`` and optional ``metadata``. Returns one flag per
+        document: False when identical content was already indexed.
+        """
+        if self.read_only:
+            raise PermissionError(f"index {self.index_path} is opened read-only")
+        added = []
+        records = []
+        with self._write_lock():
+            self._prepare_for_write()
+            for doc in documents:
+                if doc["sha256"] in self.hashes or not doc["chunks"]:
+                    added.append(False)
+                    continue
+                metadata = doc.get("metadata") or {}
+                first_id = self.index.ntotal
+                self.index.add(doc["vectors"])
+                for chunk_id, text in enumerate(doc["chunks"]):
+                    self.chunks.append({
+                        "id": first_id + chunk_id,
+                        "source": doc["filename"],
+                        "chunk_id": chunk_id,
+                        "text": text,
+                        "metadata": metadata
+                    })
+                self.documents.append({
+                    "filename": doc["filename"],
+                    "path": doc["path"],
+                    "sha256": doc["sha256"],
+                    "chunks": len(doc["chunks"]),
+                    "metadata": metadata
+                })
+                records.append(_store_record(self.documents[-1], first_id, doc["chunks"]))
+                self.hashes.add(doc["sha256"])
+                added.append(True)
+            if records:
+                self._save(records)
+        return added
+    
+    def _store_records(self):
+        """The chunk store records for everything in memory."""
+        first_id = 0
+        for document in self.documents:
+            texts = [chunk["text"] for chunk in self.chunks[first_id:first_id + document["chunks"]]]
+            yield _store_record(document, first_id, texts)
+            first_id += document["chunks"]
+    
+    def retrieve(self, question, top_k=None):
+        """Return the ``top_k`` chunks closest to ``question`` as ``Chunk``
+        records, best first."""
+        top_k = top_k or self.top_k
+        self.refresh()
+        with span("pdf.retrieve"):
+            query_vector = embed_query(question)
+            with self.lock:
+                if self.index.ntotal == 0:
+                    return []
+                distances, ids = self.index.search(query_vector, min(top_k, self.index.ntotal))
+                return [Chunk.from_dict(dict(self.chunks[i], score=float(d))) for d, i in zip(distances[0], ids[0]) if i >= 0]
     
     def query(self, question):
+        return run_sync(self.query_async(question))
+    
+    async def query_async(self, question):
+        await run_blocking(self.refresh)
+        key = f"{self.version}|{normalize_query(question)}"
+        return await self.flights.do_async(key, lambda: self._query_async(question))
+    
+    async def _query_async(self, question):
         if not self.documents:
             return "No documents uploaded yet. Please upload a PDF first."
         
@@ -38,34 +425,38 @@ class PDFRAGAgent:
             if not api_key:
                 return "Error: GEMINI_API_KEY not found in environment variables"
                 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            # Only the most relevant chunks go into the prompt, so its size
+            # stays flat however many documents have been uploaded
+            # Embedding the question can wait for Gemini quota: use the
+            # client's threads, not the pool for short jobs
+            retrieved = await run_blocking(self.retrieve, question, executor=self.gemini.executor)
+            with span("pdf.context"):
+                prompt, filenames = self._prompt(question, retrieved)
             
-            # Combine all PDF contents
-            all_content = ""
-            filenames = []
-            for doc in self.documents:
-                filename = doc["filename"]
-                filenames.append(filename)
-                if filename in self.pdf_contents:
-                    all_content += f"\n\n=== Content from {filename} ===\n"
-                    all_content += self.pdf_contents[filename]
+            # Generate response
+            response = await self.gemini.generate_async(prompt)
+            return f"Based on uploaded PDF(s) ({', '.join(filenames)}): {response.text}"
             
-            # Create prompt for AI
-            prompt = f"""
+        except Exception as e:
+            return f"Error querying documents: {str(e)}"
+    
+    def _prompt(self, question, retrieved):
+        """Return ``(prompt, filenames)`` for the retrieved chunks."""
+        filenames = list(dict.fromkeys(chunk.source for chunk in retrieved))
+        excerpts = "\n\n".join(
+            f"=== Excerpt from {chunk.source} (chunk {chunk.chunk_id}) ===\n{chunk.text}"
+            for chunk in retrieved
+        )
+        
+        # Create prompt for AI
+        prompt = f"""
 Based on the following PDF documents: {', '.join(filenames)}
 
-Document content:
-{all_content[:8000]}
+Relevant document excerpts:
+{excerpts}
 
 User question: {question}
 
 Please provide a detailed answer based on the PDF content. If the information is not available in the documents, please say so clearly.
 """
-            
-            # Generate response
-            response = model.generate_content(prompt)
-            return f"Based on uploaded PDF(s) ({', '.join(filenames)}): {response.text}"
-            
-        except Exception as e:
-            return f"Error querying documents: {str(e)}"
+        return prompt, filenames
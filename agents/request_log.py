@@ -0,0 +1,173 @@
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import random
+import shutil
+import atexit
+import threading
+from datetime import datetime
+
+# requests_20251005_000_4242.jsonl, requests_20251005_001_4242.jsonl.gz, ...
+# (the trailing pid is missing from segments written before it was added)
+SEGMENT_PATTERN = re.compile(
+    r'^(?P<prefix>.+)_(?P<day>\d{8})_(?P<seq>\d{3,})(?:_(?P<pid>\d+))?\.jsonl(?P<gz>\.gz)?$')
+
+
+def segment_name(prefix, day, seq, pid=None):
+    pid = os.getpid() if pid is None else pid
+    return f"{prefix}_{day}_{seq:03d}_{pid}.jsonl"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        pass
+    return True
+
+
+def list_segments(log_dir, prefix='requests'):
+    """Return ``(day, seq, filename)`` for every log segment, oldest first."""
+    segments = []
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return segments
+    for name in names:
+        match = SEGMENT_PATTERN.match(name)
+        if match and match.group('prefix') == prefix:
+            segments.append((match.group('day'), int(match.group('seq')), name))
+    return sorted(segments)
+
+
+class RequestLogWriter:
+    """Append-only, line-delimited request log written by a background thread.
+
+    ``log()`` only enqueues the entry, so logging costs the same for every
+    request and never blocks the response. The writer thread appends one
+    JSON object per line to ``<log_dir>/<prefix>_YYYYMMDD_NNN_<pid>.jsonl``,
+    starting a new segment each day and whenever the current one reaches
+    ``max_bytes``. Closed segments are optionally gzipped.
+
+    Each process writes its own segments: buffered appends from several
+    processes to one file can interleave mid-line once a batch is larger
+    than the filesystem writes atomically.
+
+    Full ``agent_responses`` payloads are kept for a ``sample_rate``
+    fraction of entries; the rest keep only each response's size.
+    """
+
+    def __init__(self, log_dir='logs', prefix='requests', max_bytes=None, compress=None,
+                 sample_rate=None, queue_size=10000):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes or int(os.environ.get("LOG_MAX_BYTES", 64 * 1024 * 1024))
+        if compress is None:
+            compress = os.environ.get("LOG_COMPRESS", "").lower() in ("1", "true", "yes")
+        self.compress = compress
+        if sample_rate is None:
+            sample_rate = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.file = None
+        self.day = None
+        self.seq = None
+        os.makedirs(log_dir, exist_ok=True)
+
+        self.thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, entry):
+        if 'agent_responses' in entry and random.random() >= self.sample_rate:
+            entry = dict(entry)
+            entry['agent_responses'] = {
+                name: {"sampled_out": True, "chars": len(str(response))}
+                for name, response in entry['agent_responses'].items()
+            }
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            # Dropping a log line beats stalling a request behind the disk
+            self.dropped += 1
+
+    def close(self, timeout=5):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            batch = [entry]
+            # Drain whatever else is waiting so it goes out in one write
+            while entry is not None:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(entry)
+
+            stop = batch[-1] is None
+            lines = [json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in batch if item is not None]
+            if lines:
+                try:
+                    self._write("".join(lines))
+                except Exception as e:
+                    print(f"Logging error: {e}")
+            if stop:
+                if self.file:
+                    self.file.close()
+                return
+
+    def _write(self, data):
+        day = datetime.now().strftime('%Y%m%d')
+        if self.file is None or day != self.day or self.file.tell() >= self.max_bytes:
+            self._open_segment(day)
+        self.file.write(data)
+        self.file.flush()
+
+    def _open_segment(self, day):
+        if self.file:
+            self.file.close()
+        # Take today's newest sequence number across all processes, so
+        # names still sort roughly by time, and move past it if our own
+        # segment with that number is already full
+        todays = [seq for seg_day, seq, _ in list_segments(self.log_dir, self.prefix) if seg_day == day]
+        seq = max(todays) if todays else 0
+        path = os.path.join(self.log_dir, segment_name(self.prefix, day, seq))
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+            seq += 1
+            path = os.path.join(self.log_dir, segment_name(self.prefix, day, seq))
+        self.file = open(path, 'a', encoding='utf-8')
+        self.day, self.seq = day, seq
+        if self.compress:
+            self._compress_closed_segments()
+
+    def _compress_closed_segments(self, grace_seconds=60):
+        current = segment_name(self.prefix, self.day, self.seq)
+        for _, _, name in list_segments(self.log_dir, self.prefix):
+            path = os.path.join(self.log_dir, name)
+            # Leave the active segment, and any segment another process may
+            # still be finishing, alone
+            if name == current or name.endswith('.gz') or time.time() - os.path.getmtime(path) < grace_seconds:
+                continue
+            pid = SEGMENT_PATTERN.match(name).group('pid')
+            if pid and int(pid) != os.getpid() and _pid_alive(int(pid)):
+                # Possibly still open in a live sibling, idle or not
+                continue
+            try:
+                with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(path + '.gz.tmp', path + '.gz')
+                os.remove(path)
+            except OSError as e:
+                print(f"Logging error: could not compress {name}: {e}")
+
@@ -0,0 +1,140 @@
+"""
+Embedding-centroid query router.
+
+Each agent is represented by the mean embedding (centroid) of the queries
+previously routed to it, as recorded in the request logs. A new query is
+embedded once and scored against every centroid with a single matrix
+product; the agents whose centroids it sits close to are called.
+
+Train centroids from the logs with:
+    python -m agents.semantic_router [log_dir] [--output routing_centroids.npz]
+"""
+import os
+import argparse
+import numpy as np
+from agents.embeddings import embed_texts
+from agents.log_reader import RequestLogReader
+from agents.orchestrator import canonical_agent_name
+
+DEFAULT_CENTROIDS_PATH = os.environ.get("ROUTER_CENTROIDS_PATH", "routing_centroids.npz")
+# Agents with fewer logged examples than this get no centroid and stay rule-routed
+MIN_EXAMPLES = 3
+# Training and routing must embed with the same task type
+TASK_TYPE = "classification"
+
+
+def collect_examples(log_dir='logs'):
+    """Return ``(query, agents)`` for every routed request in the logs."""
+    reader = RequestLogReader(log_dir)
+    examples = []
+    cursor = None
+    while True:
+        entries, cursor = reader.page(limit=500, cursor=cursor)
+        for entry in entries:
+            query = entry.get('query') or entry.get('question')
+            agents = entry.get('agents_used') or (entry.get('decision') or {}).get('agents') or []
+            agents = sorted({canonical_agent_name(agent) for agent in agents} - {None})
+            if query and agents:
+                examples.append((query, agents))
+        if cursor is None:
+            return examples
+
+
+def train_centroids(examples, embed_fn=None):
+    """Return ``(agents, centroids, counts)`` with one L2-normalized centroid
+    row per agent that has at least ``MIN_EXAMPLES`` examples."""
+    embed_fn = embed_fn or (lambda texts: embed_texts(texts, task_type=TASK_TYPE))
+    vectors = embed_fn([query for query, _ in examples])
+
+    agents, centroids, counts = [], [], []
+    for agent in sorted({agent for _, routed in examples for agent in routed}):
+        rows = [i for i, (_, routed) in enumerate(examples) if agent in routed]
+        if len(rows) < MIN_EXAMPLES:
+            continue
+        centroid = vectors[rows].mean(axis=0)
+        agents.append(agent)
+        centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+        counts.append(len(rows))
+    return agents, np.asarray(centroids, dtype='float32'), counts
+
+
+class CentroidRouter:
+    """Scores a query embedding against per-agent centroids.
+
+    An agent is selected when its cosine similarity is at least ``threshold``
+    and within ``margin`` of the best-scoring agent. Agents without a
+    centroid fall back to the keyword rules.
+    """
+
+    def __init__(self, path=DEFAULT_CENTROIDS_PATH, threshold=None, margin=None, embed_fn=None):
+        self.path = path
+        self.threshold = threshold if threshold is not None else float(os.environ.get("ROUTER_THRESHOLD", 0.55))
+        self.margin = margin if margin is not None else float(os.environ.get("ROUTER_MARGIN", 0.08))
+        self.embed_fn = embed_fn or (lambda texts: embed_texts(texts, task_type=TASK_TYPE))
+        self.agents = []
+        self.centroids = None
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def ready(self):
+        return self.centroids is not None and len(self.agents) > 0
+
+    def load(self, path):
+        data = np.load(path)
+        self.agents = [str(agent) for agent in data['agents']]
+        self.centroids = data['centroids'].astype('float32')
+
+    def save(self, path, counts=None):
+        np.savez(path, agents=np.asarray(self.agents), centroids=self.centroids,
+                 counts=np.asarray(counts if counts is not None else []))
+
+    def scores(self, queries):
+        """Return an ``(n_queries, n_agents)`` matrix of cosine similarities."""
+        return self.embed_fn(list(queries)) @ self.centroids.T
+
+    def select(self, scores, rule_agents, has_pdf=False):
+        """Pick agents from one row of ``scores``, merged with the rule-matched
+        agents that have no centroid."""
+        best = float(scores.max())
+        selected = {
+            agent for agent, score in zip(self.agents, scores)
+            if score >= self.threshold and score >= best - self.margin
+        }
+        selected |= {agent for agent in rule_agents if agent not in self.agents}
+        if not has_pdf:
+            selected.discard("PDF_RAG")
+        return selected
+
+    def describe(self, scores):
+        return ", ".join(f"{agent}={score:.2f}" for agent, score in zip(self.agents, scores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train routing centroids from request logs")
+    parser.add_argument('log_dir', nargs='?', default='logs')
+    parser.add_argument('--output', default=DEFAULT_CENTROIDS_PATH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    examples = collect_examples(args.log_dir)
+    if not examples:
+        print(f"No routed requests found in {args.log_dir}")
+        return
+    agents, centroids, counts = train_centroids(examples)
+    if not agents:
+        print(f"Not enough examples: every agent needs at least {MIN_EXAMPLES} routed queries")
+        return
+
+    router = CentroidRouter(path=None)
+    router.agents, router.centroids = agents, centroids
+    router.save(args.output, counts)
+    print(f"Trained centroids from {len(examples)} queries -> {args.output}")
+    for agent, count in zip(agents, counts):
+        print(f"  {agent}: {count} examples")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent work.
+
+    While a call for a key is in flight, further callers with the same key
+    wait for it and share its result (or its exception) instead of starting
+    their own. Once it finishes the key is forgotten, so this never serves
+    old results; caching is the caches' job.
+
+    ``do`` is for threads, ``do_async`` for coroutines on one event loop.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.tasks = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, fn):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        # A waiter that is cancelled (say, by its deadline) must not cancel
+        # the work the other waiters are sharing
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
@@ -0,0 +1,113 @@
+"""
+Per-request timing spans.
+
+A ``Trace`` collects ``Timing`` records for one request. ``span(name)``
+times a block against the current trace, which is found through a context
+variable, so agents record their stages without a trace being passed
+around; outside a trace it does nothing. Context variables follow asyncio
+tasks on their own; the executor, ``run_sync`` and ``run_blocking`` carry
+them onto their threads.
+
+Set TRACE_DIR to also write each trace as a Trace Event Format file, which
+Perfetto (ui.perfetto.dev), chrome://tracing and speedscope show as a
+flame chart with one row per agent.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from agents.models import Timing
+
+TRACE_DIR = os.environ.get("TRACE_DIR")
+
+_trace = contextvars.ContextVar("trace", default=None)
+_track = contextvars.ContextVar("track", default=None)
+
+
+class Trace:
+    def __init__(self, name="request"):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def record(self, name, start, end, track=None):
+        timing = Timing(name, round((start - self.start) * 1000, 2), round((end - start) * 1000, 2), track)
+        with self.lock:
+            self.spans.append(timing)
+
+    def timings(self):
+        """The spans so far as dicts, in start order."""
+        with self.lock:
+            # Parents before the children that start with them
+            spans = sorted(self.spans, key=lambda timing: (timing.start_ms, -timing.duration_ms))
+        return [timing.to_dict() for timing in spans]
+
+    def chrome_trace(self):
+        tracks = {}
+        events = []
+        for timing in self.timings():
+            tid = tracks.setdefault(timing["track"] or self.name, len(tracks) + 1)
+            events.append({"name": timing["name"], "ph": "X", "pid": 1, "tid": tid,
+                           "ts": round(timing["start_ms"] * 1000), "dur": round(timing["duration_ms"] * 1000)})
+        for track, tid in tracks.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}})
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.id, "name": self.name, "started_at": self.started_at}
+        }
+
+    def export(self, directory=None):
+        """Write the trace under ``directory`` (default TRACE_DIR); returns
+        the path, or None when exporting is off."""
+        directory = directory or TRACE_DIR
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))
+        path = os.path.join(directory, f"{stamp}_{self.name}_{self.id}.json")
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.chrome_trace(), f)
+        except OSError as e:
+            print(f"Warning: could not write trace {path}: {e}")
+            return None
+        return path
+
+
+@contextmanager
+def trace(name="request"):
+    """Make a new Trace current for the block; the block itself is its
+    root span."""
+    current = Trace(name)
+    token = _trace.set(current)
+    try:
+        with span(name):
+            yield current
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name, track=None):
+    """Time the block as stage ``name`` of the current trace. ``track``
+    (an agent name) applies to nested spans as well."""
+    current = _trace.get()
+    if current is None:
+        yield
+        return
+    token = _track.set(track) if track else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.record(name, start, time.perf_counter(), _track.get())
+        if token is not None:
+            _track.reset(token)
@@ -1,61 +1,125 @@
 ﻿import os
-import requests
-import google.generativeai as genai
 from bs4 import BeautifulSoup
 import time
+from agents.cache import TieredCache, normalize_query
+from agents.http_client import get_client
+from agents.gemini_client import get_gemini
+from agents.models import SearchHit
+from agents.aio import run_sync, run_blocking
+from agents.singleflight import SingleFlight
+from agents.tracing import span
+
+# Overridable so benchmarks can point at a local stand-in
+DDG_HTML_URL = os.environ.get("DDG_HTML_URL", "https://html.duckduckgo.com/html/")
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def search_url(query):
+    # Use DuckDuckGo search (no API key required)
+    return f"{DDG_HTML_URL}?q={query.replace(' ', '+')}"
+
+def format_hits(hits):
+    """Numbered plain-text listing of ``SearchHit`` records."""
+    lines = []
+    for i, hit in enumerate(hits, 1):
+        lines += [f"{i}. {hit.title}", f"   {hit.snippet}", f"   URL: {hit.url}", ""]
+    return "\n".join(lines)
 
 class WebSearchAgent:
-    def __init__(self):
-        pass
+    def __init__(self, cache=None, http=None, gemini=None):
+        self.http = http or get_client()
+        self.gemini = gemini or get_gemini()
+        # Identical searches already in flight are joined, not repeated
+        self.flights = SingleFlight()
+        # Repeat and trending queries are answered from cache: fresh for
+        # WEB_SEARCH_CACHE_TTL seconds, then served stale while refreshing
+        self.cache = cache or TieredCache(
+            "web_search",
+            ttl=int(os.environ.get("WEB_SEARCH_CACHE_TTL", 900)),
+            stale_ttl=int(os.environ.get("WEB_SEARCH_CACHE_STALE_TTL", 3600)),
+            negative_ttl=int(os.environ.get("WEB_SEARCH_CACHE_NEGATIVE_TTL", 300))
+        )
     
     def search(self, query, max_results=5):
+        return run_sync(self.search_async(query, max_results))
+    
+    async def search_async(self, query, max_results=5):
+        key = f"{normalize_query(query)}|{max_results}"
+        return await self.flights.do_async(
+            key, lambda: self.cache.fetch_async(key, lambda: self._search_async(query, max_results))
+        )
+    
+    def search_hits(self, query, max_results=5):
+        """Raw search hits (title, snippet, url) without an LLM summary, for
+        single-pass synthesis. Returns None when DuckDuckGo is unavailable."""
+        key = f"hits|{normalize_query(query)}|{max_results}"
+        hits = self.flights.do(key, lambda: self.cache.fetch(key, lambda: self._hits(query, max_results)))
+        return None if hits is None else [SearchHit.from_dict(hit) for hit in hits]
+    
+    def _hits(self, query, max_results):
+        hits = self.fetch_hits(query, max_results)
+        if hits is None:
+            return None, None
+        # The cache stores plain JSON
+        return [hit.to_dict() for hit in hits], "positive" if hits else "negative"
+    
+    def fetch_hits(self, query, max_results=5):
+        """Scrape DuckDuckGo into ``SearchHit`` records; returns None if it
+        answers with an error status."""
+        with span("ddg.fetch"):
+            response = self.http.get(search_url(query), headers=HEADERS)
+        if response.status_code != 200:
+            return None
+        return self._parse_hits(response.content, max_results)
+    
+    async def fetch_hits_async(self, query, max_results=5):
+        with span("ddg.fetch"):
+            response = await self.http.get_async(search_url(query), headers=HEADERS)
+        if response.status_code != 200:
+            return None
+        # Parsing is CPU work: keep it off the event loop
+        return await run_blocking(self._parse_hits, response.content, max_results)
+    
+    def _parse_hits(self, content, max_results):
+        with span("ddg.parse"):
+            return self._extract_hits(content, max_results)
+    
+    def _extract_hits(self, content, max_results):
+        soup = BeautifulSoup(content, 'html.parser')
+        
+        # Extract search results
+        results = []
+        result_elements = soup.find_all('div', class_='result')[:max_results]
+        
+        for element in result_elements:
+            title_element = element.find('a', class_='result__a')
+            snippet_element = element.find('a', class_='result__snippet')
+            
+            if title_element and snippet_element:
+                title = title_element.get_text().strip()
+                snippet = snippet_element.get_text().strip()
+                url = title_element.get('href', '')
+                
+                results.append(SearchHit(title, snippet, url))
+        
+        return results
+    
+    async def _search_async(self, query, max_results):
+        """Scrape and summarize; returns ``(result, cache_as)`` for TieredCache.fetch_async."""
         try:
             # Get API key from environment
             api_key = os.environ.get("GEMINI_API_KEY")
             if not api_key:
-                return "Error: GEMINI_API_KEY not found in environment variables"
+                return "Error: GEMINI_API_KEY not found in environment variables", None
                 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
-            # Use DuckDuckGo search (no API key required)
-            search_url = f"https://html.duckduckgo.com/html/?q={query.replace(' ', '+')}"
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(search_url, headers=headers, timeout=10)
+            results = await self.fetch_hits_async(query, max_results)
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Extract search results
-                results = []
-                result_elements = soup.find_all('div', class_='result')[:max_results]
-                
-                for element in result_elements:
-                    title_element = element.find('a', class_='result__a')
-                    snippet_element = element.find('a', class_='result__snippet')
-                    
-                    if title_element and snippet_element:
-                        title = title_element.get_text().strip()
-                        snippet = snippet_element.get_text().strip()
-                        url = title_element.get('href', '')
-                        
-                        results.append({
-                            'title': title,
-                            'snippet': snippet,
-                            'url': url
-                        })
-                
+            if results is not None:
                 if results:
                     # Format results for AI summarization
-                    search_results_text = ""
-                    for i, result in enumerate(results, 1):
-                        search_results_text += f"{i}. {result['title']}\n"
-                        search_results_text += f"   {result['snippet']}\n"
-                        search_results_text += f"   URL: {result['url']}\n\n"
+                    search_results_text = format_hits(results)
                     
                     # Use AI to provide a comprehensive summary
                     prompt = f"""
@@ -66,12 +130,12 @@ Based on the following web search results for the query "{query}":
 Please provide a comprehensive, informative summary that answers the user's query. Include the most relevant information from the search results and mention key sources when appropriate.
 """
                     
-                    ai_response = model.generate_content(prompt)
+                    ai_response = await self.gemini.generate_async(prompt)
                     
-                    return f"Web search results for '{query}':\n\n{ai_response.text}\n\nSources:\n{search_results_text}"
+                    return f"Web search results for '{query}':\n\n{ai_response.text}\n\nSources:\n{search_results_text}", "positive"
                 
                 else:
-                    return f"No search results found for '{query}'. Please try a different query."
+                    return f"No search results found for '{query}'. Please try a different query.", "negative"
             
             else:
                 # Fallback: Use AI to provide general knowledge response
@@ -81,26 +145,23 @@ The user asked about: "{query}"
 Please provide a helpful, informative response based on your knowledge. Make it clear that this is based on general knowledge rather than current web search results.
 """
                 
-                ai_response = model.generate_content(prompt)
-                return f"Based on general knowledge (web search unavailable): {ai_response.text}"
+                ai_response = await self.gemini.generate_async(prompt)
+                return f"Based on general knowledge (web search unavailable): {ai_response.text}", None
                 
         except Exception as e:
             # Fallback: Use AI for general knowledge
             try:
                 api_key = os.environ.get("GEMINI_API_KEY")
                 if api_key:
-                    genai.configure(api_key=api_key)
-                    model = genai.GenerativeModel('gemini-2.0-flash')
-                    
                     prompt = f"""
 The user asked: "{query}"
 
 Please provide a helpful response based on your knowledge. Note that real-time web search is currently unavailable.
 """
                     
-                    ai_response = model.generate_content(prompt)
-                    return f"Response based on AI knowledge (web search error): {ai_response.text}"
+                    ai_response = await self.gemini.generate_async(prompt)
+                    return f"Response based on AI knowledge (web search error): {ai_response.text}", None
                 else:
-                    return f"Error performing web search: {str(e)}"
+                    return f"Error performing web search: {str(e)}", None
             except:
-                return f"Error performing web search and AI fallback: {str(e)}"
+                return f"Error performing web search and AI fallback: {str(e)}", None
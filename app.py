@@ -1,7 +1,8 @@
 import os
 import json
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from functools import partial
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
@@ -12,7 +13,19 @@ from agents.controller_agent import ControllerAgent
 from agents.pdf_rag_agent import PDFRAGAgent
 from agents.web_search_agent import WebSearchAgent
 from agents.arxiv_agent import ArxivAgent
-import google.generativeai as genai
+from agents.orchestrator import AgentExecutor
+from agents.ingest_jobs import IngestionJobQueue, JobQueueFull, upload_path
+from agents.request_log import RequestLogWriter
+from agents.log_reader import RequestLogReader, page_args
+from agents.gemini_client import get_gemini
+from agents.evidence import grounded_prompt, evidence_sources
+from agents.models import to_jsonable
+from agents.aio import run_sync
+from agents.singleflight import SingleFlight
+from agents.cache import normalize_query
+from agents.admission import AdmissionController, Rejected, client_id
+from agents.tracing import trace, span
+from agents.metrics import instrument
 
 app = Flask(__name__, static_folder='frontend', static_url_path='')
 CORS(app, origins='*')
@@ -21,18 +34,34 @@ UPLOAD_FOLDER = 'uploads'
 MAX_FILE_SIZE = 16 * 1024 * 1024
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# "per_agent": each agent summarizes its findings with Gemini and the
+# summaries are combined by a synthesis call. "single_pass": agents return
+# raw evidence and one grounded synthesis call answers from all of it.
+# Overridable per request with {"mode": ...}.
+SYNTHESIS_MODES = ("per_agent", "single_pass")
+SYNTHESIS_MODE = os.environ.get("SYNTHESIS_MODE", "per_agent")
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('logs', exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
-
 controller = ControllerAgent()
 pdf_rag = PDFRAGAgent()
 web_search = WebSearchAgent()
 arxiv_agent = ArxivAgent()
+executor = AgentExecutor()
+# Identical questions asked while one is being answered share that answer
+question_flights = SingleFlight()
+# Bounds concurrent /ask work and queueing, with per-client rate limits
+admission = AdmissionController()
+ingest_jobs = IngestionJobQueue(pdf_rag)
+request_log = RequestLogWriter('logs')
+log_reader = RequestLogReader('logs')
+
+# Per-route request metrics and /metrics
+instrument(app, lambda: {"pdf_rag": pdf_rag, "admission": admission, "llm_cache": get_gemini().cache})
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -54,16 +83,24 @@ def upload_pdf():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
-            result = pdf_rag.add_pdf(filepath)
+            # Index in the background; the client polls /jobs/<job_id>
+            try:
+                job = ingest_jobs.submit(filepath)
+            except JobQueueFull as e:
+                response = jsonify({"error": str(e)})
+                response.headers['Retry-After'] = '10'
+                return response, 503
             
             return jsonify({
                 "success": True,
-                "message": result,
-                "filename": filename
-            })
+                "message": f"Uploaded {filename}, indexing in the background",
+                "filename": filename,
+                "job_id": job["id"],
+                "status_url": f"/jobs/{job['id']}"
+            }), 202
         
         return jsonify({"error": "Invalid file type. Only PDF files are allowed."}), 400
     
@@ -71,83 +108,213 @@ def upload_pdf():
         print(f"Upload error: {str(e)}")  # Log to console for debugging
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
-@app.route('/ask', methods=['POST'])
-def ask():
-    print(f"Ask route called - request data: {request.json}")  # Debug log
-    data = request.json
-    query = data.get('query', '')
-    print(f"Query received: {query}")  # Debug log
-    
-    if not query:
-        return jsonify({"error": "No query provided"}), 400
-    
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+def web_evidence(query):
+    hits = web_search.search_hits(query)
+    if hits is None:
+        raise RuntimeError("Web search unavailable")
+    return hits
+
+def arxiv_evidence(query):
+    papers = arxiv_agent.fetch_papers(query)
+    if papers is None:
+        raise RuntimeError("ArXiv search unavailable")
+    return papers
+
+def agent_calls(query, agents_called, mode=SYNTHESIS_MODE, use_async=False):
+    """Build the executor's calls for the routed agents. With ``use_async``
+    the per-agent answers come from the agents' coroutine methods."""
+    calls = {}
+    if mode == "single_pass":
+        if 'PDF_RAG' in agents_called:
+            calls['PDF_RAG'] = partial(pdf_rag.retrieve, query)
+        if 'WEB_SEARCH' in agents_called:
+            calls['WEB_SEARCH'] = partial(web_evidence, query)
+        if 'ARXIV' in agents_called:
+            calls['ARXIV'] = partial(arxiv_evidence, query)
+    elif use_async:
+        if 'PDF_RAG' in agents_called:
+            calls['PDF_RAG'] = partial(pdf_rag.query_async, query)
+        if 'WEB_SEARCH' in agents_called:
+            calls['WEB_SEARCH'] = partial(web_search.search_async, query)
+        if 'ARXIV' in agents_called:
+            calls['ARXIV'] = partial(arxiv_agent.search_papers_async, query)
+    else:
+        if 'PDF_RAG' in agents_called:
+            calls['PDF_RAG'] = partial(pdf_rag.query, query)
+        if 'WEB_SEARCH' in agents_called:
+            calls['WEB_SEARCH'] = partial(web_search.search, query)
+        if 'ARXIV' in agents_called:
+            calls['ARXIV'] = partial(arxiv_agent.search_papers, query)
+    return calls
+
+def plan_query(query, mode=SYNTHESIS_MODE):
+    """Route ``query`` and return ``(has_pdf, decision, agents_called, calls)``."""
     has_pdf = len(pdf_rag.documents) > 0
     
     decision = controller.analyze_query(query, has_pdf)
     
     agents_called = decision.get('agents', [])
-    agent_responses = {}
     
-    if 'PDF_RAG' in agents_called:
-        try:
-            rag_result = pdf_rag.query(query)
-            agent_responses['PDF_RAG'] = rag_result
-        except Exception as e:
-            agent_responses['PDF_RAG'] = {"error": str(e)}
+    # Run every routed agent concurrently, each with its own deadline
+    return has_pdf, decision, agents_called, agent_calls(query, agents_called, mode)
+
+async def answer_async(query, mode=SYNTHESIS_MODE):
+    """Route, run the agents and synthesize on the shared event loop; returns
+    the /ask payload."""
+    has_pdf = len(pdf_rag.documents) > 0
     
-    if 'WEB_SEARCH' in agents_called:
-        try:
-            web_result = web_search.search(query)
-            agent_responses['WEB_SEARCH'] = web_result
-        except Exception as e:
-            agent_responses['WEB_SEARCH'] = {"error": str(e)}
+    decision = await controller.analyze_query_async(query, has_pdf)
     
-    if 'ARXIV' in agents_called:
-        try:
-            arxiv_result = arxiv_agent.search_papers(query)
-            agent_responses['ARXIV'] = arxiv_result
-        except Exception as e:
-            agent_responses['ARXIV'] = {"error": str(e)}
+    agents_called = decision.get('agents', [])
+    
+    calls = agent_calls(query, agents_called, mode, use_async=True)
+    agent_responses = await executor.run_async(calls)
     
-    final_answer = synthesize_answer(query, agent_responses)
+    final_answer = await synthesize_answer_async(query, agent_responses, mode)
     
     response = {
         "query": query,
         "decision": decision,
         "agents_used": agents_called,
-        "agent_responses": agent_responses,
+        "agent_responses": to_jsonable(agent_responses),
+        "has_pdf": has_pdf,
+        "mode": mode,
         "final_answer": final_answer,
         "timestamp": datetime.now().isoformat()
     }
+    if mode == "single_pass":
+        response["sources"] = evidence_sources(agent_responses)
+    return response
+
+@app.route('/ask', methods=['POST'])
+def ask():
+    print(f"Ask route called - request data: {request.json}")  # Debug log
+    data = request.json
+    query = data.get('query', '')
+    print(f"Query received: {query}")  # Debug log
+    
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    
+    mode = data.get('mode') or SYNTHESIS_MODE
+    if mode not in SYNTHESIS_MODES:
+        return jsonify({"error": f"Unknown mode '{mode}', expected one of {', '.join(SYNTHESIS_MODES)}"}), 400
+    
+    with trace("ask") as request_trace:
+        try:
+            with span("queue"):
+                ticket = admission.acquire(client_id(request))
+        except Rejected as e:
+            return rejected_response(e)
+        
+        try:
+            # The document-set version keeps answers from spanning an upload
+            key = f"{mode}|{pdf_rag.version}|{normalize_query(query)}"
+            response = dict(run_sync(question_flights.do_async(key, lambda: answer_async(query, mode))))
+        finally:
+            admission.release(ticket)
     
+    response["queue"] = {"wait_ms": ticket.wait_ms, "depth": ticket.queue_depth}
+    # A coalesced request only times its own wait; the stages ran in the leader's trace
+    response["timings"] = request_trace.timings()
+    request_trace.export()
     log_request(response)
     
-    return jsonify(response)
+    return queue_headers(jsonify(response), ticket)
 
-def synthesize_answer(query, agent_responses):
-    if not agent_responses:
-        return "No agents were able to process your query."
+def rejected_response(e):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after, "queue": admission.stats()})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def queue_headers(response, ticket):
+    response.headers['X-Queue-Wait-Ms'] = str(ticket.wait_ms)
+    response.headers['X-Queue-Depth'] = str(ticket.queue_depth)
+    return response
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/ask/stream', methods=['GET', 'POST'])
+def ask_stream():
+    """Server-sent events version of /ask.
+    
+    Emits ``decision`` once routing is done, one ``agent`` event per agent
+    as it finishes, ``token`` events while the answer is synthesized and a
+    final ``done`` event carrying the same payload /ask returns.
+    """
+    data = request.get_json(silent=True) or {}
+    query = data.get('query') or request.args.get('query', '')
+    
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    
+    mode = data.get('mode') or request.args.get('mode') or SYNTHESIS_MODE
+    if mode not in SYNTHESIS_MODES:
+        return jsonify({"error": f"Unknown mode '{mode}', expected one of {', '.join(SYNTHESIS_MODES)}"}), 400
+    
+    try:
+        ticket = admission.acquire(client_id(request))
+    except Rejected as e:
+        return rejected_response(e)
+    
+    def generate():
+        has_pdf, decision, agents_called, calls = plan_query(query, mode)
+        yield sse("decision", dict(decision, queue={"wait_ms": ticket.wait_ms, "depth": ticket.queue_depth}))
+        
+        agent_responses = {}
+        for name, result in executor.iter_run(calls):
+            agent_responses[name] = result
+            yield sse("agent", result.to_dict())
+        # Synthesize from the responses in routing order, as /ask does
+        agent_responses = {name: agent_responses[name] for name in calls}
+        
+        parts = []
+        for text in stream_synthesis(query, agent_responses, mode):
+            parts.append(text)
+            yield sse("token", {"text": text})
+        
+        response = {
+            "query": query,
+            "decision": decision,
+            "agents_used": agents_called,
+            "agent_responses": to_jsonable(agent_responses),
+            "has_pdf": has_pdf,
+            "mode": mode,
+            "final_answer": "".join(parts),
+            "timestamp": datetime.now().isoformat()
+        }
+        if mode == "single_pass":
+            response["sources"] = evidence_sources(agent_responses)
+        log_request(response)
+        yield sse("done", response)
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The slot is held until the stream ends or the client goes away
+    response.call_on_close(lambda: admission.release(ticket))
+    return queue_headers(response, ticket)
+
+def synthesis_prompt(query, agent_responses, mode="per_agent"):
+    """Return ``(prompt, context)`` for combining the agent responses."""
+    if mode == "single_pass":
+        prompt, _, context = grounded_prompt(query, agent_responses)
+        return prompt, context
     
     context_parts = []
     
-    for agent_name, response in agent_responses.items():
-        if isinstance(response, dict) and 'error' in response:
-            context_parts.append(f"{agent_name}: Error - {response['error']}")
-        elif isinstance(response, str):
-            # Response is a string directly from the agent
-            context_parts.append(f"{agent_name}: {response}")
-        elif isinstance(response, dict):
-            # Response is a dictionary, try to extract meaningful content
-            if agent_name == 'PDF_RAG':
-                context_parts.append(f"PDF RAG: {response.get('answer', response)}")
-            elif agent_name == 'WEB_SEARCH':
-                context_parts.append(f"Web Search: {response.get('summary', response)}")
-            elif agent_name == 'ARXIV':
-                context_parts.append(f"ArXiv: {response.get('summary', response)}")
-            else:
-                context_parts.append(f"{agent_name}: {response}")
+    for agent_name, result in agent_responses.items():
+        if not result.ok:
+            context_parts.append(f"{agent_name}: Error - {result.error}")
         else:
-            context_parts.append(f"{agent_name}: {str(response)}")
+            context_parts.append(f"{agent_name}: {result.output}")
     
     context = "\n\n".join(context_parts) 
     prompt = f"""You are synthesizing answers from multiple AI agents. Combine the following agent responses into a single, coherent answer to the user's question.
@@ -158,47 +325,72 @@ Agent Responses:
 {context}
 
 Synthesized Answer:"""
+    return prompt, context
+
+def synthesize_answer(query, agent_responses, mode="per_agent"):
+    return run_sync(synthesize_answer_async(query, agent_responses, mode))
+
+async def synthesize_answer_async(query, agent_responses, mode="per_agent"):
+    if not agent_responses:
+        return "No agents were able to process your query."
     
-    try:
-        # Use Google Generative AI to synthesize the final answer
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
-        return response.text or "Unable to synthesize answer."
-    except Exception as e:
-        return f"Error synthesizing answer: {str(e)}\n\nRaw responses:\n{context}"
+    with span("synthesis"):
+        prompt, context = synthesis_prompt(query, agent_responses, mode)
+        
+        try:
+            # Use Google Generative AI to synthesize the final answer
+            response = await get_gemini().generate_async(prompt)
+            return response.text or "Unable to synthesize answer."
+        except Exception as e:
+            return f"Error synthesizing answer: {str(e)}\n\nRaw responses:\n{context}"
 
-def log_request(data):
-    log_file = f"logs/requests_{datetime.now().strftime('%Y%m%d')}.json"
+def stream_synthesis(query, agent_responses, mode="per_agent"):
+    """Streaming ``synthesize_answer``: yields the answer in chunks."""
+    if not agent_responses:
+        yield "No agents were able to process your query."
+        return
     
+    prompt, context = synthesis_prompt(query, agent_responses, mode)
+    
+    streamed = False
     try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        
-        logs.append(data)
-        
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
+        for text in get_gemini().generate_stream(prompt):
+            streamed = True
+            yield text
+        if not streamed:
+            yield "Unable to synthesize answer."
     except Exception as e:
-        print(f"Logging error: {e}")
+        separator = "\n\n" if streamed else ""
+        yield f"{separator}Error synthesizing answer: {str(e)}\n\nRaw responses:\n{context}"
+
+def log_request(data):
+    # Appended to logs/requests_YYYYMMDD_NNN_<pid>.jsonl by a background thread
+    request_log.log(data)
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        "status": "healthy",
+        "queue": admission.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
 
 @app.route('/logs', methods=['GET'])
 def get_logs():
+    # ?limit=&cursor=&since=&until=&agent=&has_pdf=&error=, newest first
+    try:
+        filters = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
     try:
         controller_logs = controller.get_logs()
-        
-        log_files = [f for f in os.listdir('logs') if f.endswith('.json')]
-        request_logs = []
-        
-        for log_file in sorted(log_files, reverse=True)[:5]:
-            with open(os.path.join('logs', log_file), 'r') as f:
-                request_logs.extend(json.load(f))
+        request_logs, next_cursor = log_reader.page(**filters)
         
         return jsonify({
             "controller_logs": controller_logs,
-            "request_logs": request_logs[-50:]
+            "request_logs": request_logs,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1,10 +1,18 @@
 import os
 import json
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from functools import partial
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from agents.request_log import RequestLogWriter
+from agents.ingest_jobs import upload_path
+from agents.log_reader import RequestLogReader, page_args
+from agents.models import to_jsonable
+from agents.admission import AdmissionController, Rejected, client_id
+from agents.tracing import trace, span
+from agents.metrics import instrument
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,12 +23,16 @@ try:
     from agents.pdf_rag_agent import PDFRAGAgent
     from agents.web_search_agent import WebSearchAgent
     from agents.arxiv_agent import ArxivAgent
-    import google.generativeai as genai
+    from agents.orchestrator import AgentExecutor, canonical_agent_name
+    from agents.ingest_jobs import IngestionJobQueue, JobQueueFull
+    from agents.singleflight import SingleFlight
+    from agents.cache import normalize_query
+    from agents.gemini_client import get_gemini
     
     # Configure Gemini
     api_key = os.environ.get("GEMINI_API_KEY")
     if api_key:
-        genai.configure(api_key=api_key)
+        get_gemini().configure()
         print("✅ Gemini API configured")
     else:
         print("⚠️ Warning: GEMINI_API_KEY not found")
@@ -30,6 +42,10 @@ try:
     pdf_rag = PDFRAGAgent()
     web_search = WebSearchAgent()
     arxiv_agent = ArxivAgent()
+    executor = AgentExecutor()
+    # Identical questions asked while one is being answered share its agent run
+    question_flights = SingleFlight()
+    ingest_jobs = IngestionJobQueue(pdf_rag)
     
     agents_loaded = True
     print("✅ All agents loaded successfully")
@@ -79,6 +95,27 @@ os.makedirs('logs', exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Requests are appended to logs/requests_YYYYMMDD_NNN_<pid>.jsonl by a background thread
+request_log = RequestLogWriter('logs')
+log_reader = RequestLogReader('logs')
+
+# Bounds concurrent /ask work and queueing, with per-client rate limits
+admission = AdmissionController()
+
+# Per-route request metrics and /metrics
+instrument(app, lambda: {
+    "pdf_rag": pdf_rag if agents_loaded else None,
+    "admission": admission,
+    "llm_cache": get_gemini().cache if agents_loaded else None
+})
+
+# Response heading and "Agents Used" label for each canonical agent name
+AGENT_LABELS = {
+    'WEB_SEARCH': ("Web Search", "Web Search"),
+    'ARXIV': ("ArXiv Research", "ArXiv"),
+    'PDF_RAG': ("PDF Documents", "PDF RAG"),
+}
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -98,22 +135,92 @@ def upload_pdf():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = upload_path(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             
             if agents_loaded:
-                pdf_rag.add_pdf(filepath)
+                # Index in the background; the client polls /jobs/<job_id>
+                try:
+                    job = ingest_jobs.submit(filepath)
+                except JobQueueFull as e:
+                    response = jsonify({"error": str(e)})
+                    response.headers['Retry-After'] = '10'
+                    return response, 503
+                
+                return jsonify({
+                    "success": True,
+                    "message": f"File {filename} uploaded, indexing in the background",
+                    "filename": filename,
+                    "job_id": job["id"],
+                    "status_url": f"/jobs/{job['id']}",
+                    "agents_status": "active"
+                }), 202
             
             return jsonify({
                 "message": f"File {filename} uploaded successfully!",
                 "filename": filename,
-                "agents_status": "active" if agents_loaded else "fallback"
+                "agents_status": "fallback"
             })
         
         return jsonify({"error": "Invalid file type"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    if not agents_loaded:
+        return jsonify({"error": "PDF processing not available in fallback mode"}), 404
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+def plan_calls(question, agents_to_use, has_pdf, responses):
+    """Map the controller's agent names onto calls for the executor; notes
+    for agents that cannot run are appended to ``responses``."""
+    calls = {}
+    for agent_name in agents_to_use:
+        canonical_name = canonical_agent_name(agent_name)
+        if canonical_name == 'WEB_SEARCH':
+            calls['WEB_SEARCH'] = partial(web_search.search, question)
+        elif canonical_name == 'ARXIV':
+            calls['ARXIV'] = partial(arxiv_agent.search_papers, question)
+        elif canonical_name == 'PDF_RAG':
+            if has_pdf:
+                calls['PDF_RAG'] = partial(pdf_rag.query, question)
+            else:
+                responses.append("**PDF Documents:** No PDFs uploaded yet.")
+    return calls
+
+def add_agent_response(agent_name, result, responses, agents_used):
+    """Append one agent's section to ``responses`` and return it."""
+    if not result.ok:
+        section = f"**Error with {agent_name}:** {result.error}"
+    else:
+        heading, label = AGENT_LABELS[agent_name]
+        section = f"**{heading}:** {result.output}"
+        agents_used.append(label)
+    responses.append(section)
+    return section
+
+def compose_answer(question, responses, agents_used):
+    with span("synthesis"):
+        return _compose_answer(question, responses, agents_used)
+
+def _compose_answer(question, responses, agents_used):
+    if not responses:
+        # Default to web search
+        try:
+            response = web_search.search(question)
+            responses.append(f"**Web Search:** {response}")
+            agents_used.append("Web Search")
+        except Exception as e:
+            responses.append(f"**Fallback:** Could not process query: {str(e)}")
+    
+    final_response = "\n\n".join(responses)
+    agents_info = f"**Agents Used:** {', '.join(agents_used)}\n\n" if agents_used else ""
+    return agents_info + final_response
+
 @app.route('/ask', methods=['POST'])
 def ask_question():
     try:
@@ -123,111 +230,175 @@ def ask_question():
         
         question = data['question']
         
-        # Log the request
+        with trace("ask") as request_trace:
+            try:
+                with span("queue"):
+                    ticket = admission.acquire(client_id(request))
+            except Rejected as e:
+                return rejected_response(e)
+            try:
+                result, log_entry = answer_question(question)
+            finally:
+                admission.release(ticket)
+        
+        result["queue"] = {"wait_ms": ticket.wait_ms, "depth": ticket.queue_depth}
+        result["timings"] = log_entry["timings"] = request_trace.timings()
+        request_trace.export()
+        
+        # Save log
+        request_log.log(log_entry)
+        
+        return queue_headers(jsonify(result), ticket)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def rejected_response(e):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after, "queue": admission.stats()})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def queue_headers(response, ticket):
+    response.headers['X-Queue-Wait-Ms'] = str(ticket.wait_ms)
+    response.headers['X-Queue-Depth'] = str(ticket.queue_depth)
+    return response
+
+def answer_question(question):
+    """Route and run the agents; returns the /ask payload and its log entry."""
+    # Log the request
+    log_entry = {
+        "timestamp": datetime.now().isoformat(),
+        "question": question,
+        "method": "ask"
+    }
+    has_pdf = False
+    agent_responses = {}
+    
+    if agents_loaded:
+        # Check if PDFs are available
+        has_pdf = len(getattr(pdf_rag, 'documents', [])) > 0
+        
+        # Get routing decision
+        decision = controller.analyze_query(question, has_pdf)
+        agents_to_use = decision.get('agents', ['web'])
+        
+        responses = []
+        agents_used = []
+        
+        # Call appropriate agents concurrently, each with its own deadline
+        calls = plan_calls(question, agents_to_use, has_pdf, responses)
+        
+        key = f"{pdf_rag.version}|{','.join(calls)}|{normalize_query(question)}"
+        agent_responses = question_flights.do(key, lambda: executor.run(calls))
+        for agent_name, result in agent_responses.items():
+            add_agent_response(agent_name, result, responses, agents_used)
+        
+        answer = compose_answer(question, responses, agents_used)
+        
+    else:
+        # Fallback response
+        answer = f"**Fallback Mode:** Your question '{question}' has been received. Agents are not fully loaded, but the system is operational."
+    
+    log_entry["has_pdf"] = has_pdf
+    log_entry["agent_responses"] = to_jsonable(agent_responses)
+    log_entry["answer"] = answer
+    log_entry["agents_used"] = agents_used if agents_loaded else ["fallback"]
+    
+    return {
+        "answer": answer,
+        "agents_used": agents_used if agents_loaded else ["fallback"],
+        "agent_responses": log_entry["agent_responses"],
+        "agents_status": "active" if agents_loaded else "fallback"
+    }, log_entry
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/ask/stream', methods=['GET', 'POST'])
+def ask_stream():
+    """Server-sent events version of /ask: a ``decision`` event, one
+    ``agent`` event per agent as soon as it finishes, then ``done`` with the
+    same payload /ask returns."""
+    data = request.get_json(silent=True) or {}
+    question = data.get('question') or request.args.get('question', '')
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+    
+    try:
+        ticket = admission.acquire(client_id(request))
+    except Rejected as e:
+        return rejected_response(e)
+    
+    def generate():
         log_entry = {
             "timestamp": datetime.now().isoformat(),
             "question": question,
-            "method": "ask"
+            "method": "ask_stream"
         }
+        has_pdf = False
+        agent_responses = {}
+        agents_used = ["fallback"]
+        try:
+            if agents_loaded:
+                has_pdf = len(getattr(pdf_rag, 'documents', [])) > 0
+                decision = controller.analyze_query(question, has_pdf)
+                yield sse("decision", dict(decision, queue={"wait_ms": ticket.wait_ms, "depth": ticket.queue_depth}))
+                
+                responses = []
+                agents_used = []
+                calls = plan_calls(question, decision.get('agents', ['web']), has_pdf, responses)
+                for agent_name, result in executor.iter_run(calls):
+                    agent_responses[agent_name] = result
+                    section = add_agent_response(agent_name, result, responses, agents_used)
+                    yield sse("agent", dict(result.to_dict(), section=section))
+                
+                answer = compose_answer(question, responses, agents_used)
+            else:
+                answer = f"**Fallback Mode:** Your question '{question}' has been received. Agents are not fully loaded, but the system is operational."
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+            return
         
-        if agents_loaded:
-            # Check if PDFs are available
-            has_pdf = len(getattr(pdf_rag, 'documents', [])) > 0
-            
-            # Get routing decision
-            decision = controller.analyze_query(question, has_pdf)
-            agents_to_use = decision.get('agents', ['web'])
-            
-            responses = []
-            agents_used = []
-            
-            # Call appropriate agents
-            for agent_name in agents_to_use:
-                try:
-                    if agent_name.lower() in ['web', 'web_search'] or 'web' in agent_name.lower():
-                        response = web_search.search(question)
-                        responses.append(f"**Web Search:** {response}")
-                        agents_used.append("Web Search")
-                        
-                    elif agent_name.lower() in ['arxiv', 'research'] or 'arxiv' in agent_name.lower():
-                        response = arxiv_agent.search_papers(question)
-                        responses.append(f"**ArXiv Research:** {response}")
-                        agents_used.append("ArXiv")
-                        
-                    elif agent_name.lower() in ['pdf', 'rag'] or 'pdf' in agent_name.lower():
-                        if has_pdf:
-                            response = pdf_rag.query(question)
-                            responses.append(f"**PDF Documents:** {response}")
-                            agents_used.append("PDF RAG")
-                        else:
-                            responses.append("**PDF Documents:** No PDFs uploaded yet.")
-                            
-                except Exception as e:
-                    responses.append(f"**Error with {agent_name}:** {str(e)}")
-            
-            if not responses:
-                # Default to web search
-                try:
-                    response = web_search.search(question)
-                    responses.append(f"**Web Search:** {response}")
-                    agents_used.append("Web Search")
-                except Exception as e:
-                    responses.append(f"**Fallback:** Could not process query: {str(e)}")
-            
-            final_response = "\n\n".join(responses)
-            agents_info = f"**Agents Used:** {', '.join(agents_used)}\n\n" if agents_used else ""
-            answer = agents_info + final_response
-            
-        else:
-            # Fallback response
-            answer = f"**Fallback Mode:** Your question '{question}' has been received. Agents are not fully loaded, but the system is operational."
-        
+        log_entry["has_pdf"] = has_pdf
+        log_entry["agent_responses"] = to_jsonable(agent_responses)
         log_entry["answer"] = answer
-        log_entry["agents_used"] = agents_used if agents_loaded else ["fallback"]
-        
-        # Save log
-        log_file = f"logs/requests_{datetime.now().strftime('%Y%m%d')}.json"
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        
-        logs.append(log_entry)
+        log_entry["agents_used"] = agents_used
+        request_log.log(log_entry)
         
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
-        
-        return jsonify({
+        yield sse("done", {
             "answer": answer,
-            "agents_used": agents_used if agents_loaded else ["fallback"],
+            "agents_used": agents_used,
+            "agent_responses": log_entry["agent_responses"],
             "agents_status": "active" if agents_loaded else "fallback"
         })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The slot is held until the stream is finished or the client goes away
+    response.call_on_close(lambda: admission.release(ticket))
+    return queue_headers(response, ticket)
 
 @app.route('/logs')
 def get_logs():
+    # ?limit=&cursor=&since=&until=&agent=&has_pdf=&error=, newest first
+    try:
+        filters = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
     try:
         if agents_loaded:
             controller_logs = controller.get_logs()
         else:
             controller_logs = []
         
-        log_files = [f for f in os.listdir('logs') if f.endswith('.json')]
-        request_logs = []
-        
-        for log_file in sorted(log_files, reverse=True)[:5]:
-            try:
-                with open(os.path.join('logs', log_file), 'r') as f:
-                    request_logs.extend(json.load(f))
-            except:
-                continue
+        request_logs, next_cursor = log_reader.page(**filters)
         
         return jsonify({
             "controller_logs": controller_logs,
-            "request_logs": request_logs[-50:],
+            "request_logs": request_logs,
+            "next_cursor": next_cursor,
             "agents_status": "active" if agents_loaded else "fallback"
         })
     except Exception as e:
@@ -238,6 +409,8 @@ def health():
     return jsonify({
         "status": "healthy",
         "agents_loaded": agents_loaded,
+        "llm_cache": get_gemini().cache.stats() if agents_loaded and get_gemini().cache else None,
+        "queue": admission.stats(),
         "timestamp": datetime.now().isoformat()
     })
 
@@ -2,7 +2,14 @@ import gradio as gr
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-import google.generativeai as genai
+from agents.gemini_client import get_gemini
+from functools import partial
+from agents.orchestrator import AgentExecutor, canonical_agent_name
+from agents.ingest_jobs import JobQueueFull, upload_path
+from agents.log_reader import RequestLogReader, page_args
+from agents.models import to_jsonable
+from agents.admission import AdmissionController, Rejected, client_id
+from agents.metrics import instrument
 
 # Load environment variables
 load_dotenv()
@@ -10,11 +17,21 @@ load_dotenv()
 # Configure Gemini
 api_key = os.environ.get("GEMINI_API_KEY")
 if api_key:
-    genai.configure(api_key=api_key)
+    get_gemini().configure()
     print("✅ Gemini API configured")
 else:
     print("⚠️ Warning: GEMINI_API_KEY not found")
 
+# Agents chosen by the controller run concurrently on this executor
+executor = AgentExecutor()
+
+# Response heading and "Agents Used" label for each canonical agent name
+AGENT_LABELS = {
+    'WEB_SEARCH': ("Web Search", "Web Search"),
+    'ARXIV': ("ArXiv Research", "ArXiv"),
+    'PDF_RAG': ("PDF Documents", "PDF RAG"),
+}
+
 # Simple fallback implementations for when agents fail
 class SimpleAgents:
     @staticmethod
@@ -38,10 +55,11 @@ controller = None
 pdf_rag = None
 web_search = None
 arxiv_agent = None
+ingest_jobs = None
 
 def initialize_agents():
     """Initialize agents only when needed"""
-    global agents_loaded, controller, pdf_rag, web_search, arxiv_agent
+    global agents_loaded, controller, pdf_rag, web_search, arxiv_agent, ingest_jobs
     
     if agents_loaded:
         return True
@@ -51,11 +69,13 @@ def initialize_agents():
         from agents.pdf_rag_agent import PDFRAGAgent
         from agents.web_search_agent import WebSearchAgent
         from agents.arxiv_agent import ArxivAgent
+        from agents.ingest_jobs import IngestionJobQueue
         
         controller = ControllerAgent()
         pdf_rag = PDFRAGAgent()
         web_search = WebSearchAgent()
         arxiv_agent = ArxivAgent()
+        ingest_jobs = IngestionJobQueue(pdf_rag)
         
         agents_loaded = True
         print("✅ All agents loaded successfully")
@@ -66,9 +86,18 @@ def initialize_agents():
         return False
 
 def process_question(question, chat_history):
-    """Process user question with robust error handling"""
+    """Process user question with robust error handling.
+    
+    A generator: the chat is updated as each agent finishes instead of once
+    every agent has answered.
+    """
     if not question.strip():
-        return chat_history, ""
+        yield chat_history, ""
+        return
+    
+    chat_history.append({"role": "user", "content": question})
+    chat_history.append({"role": "assistant", "content": "⏳ Consulting agents..."})
+    yield chat_history, ""
     
     try:
         # Initialize agents on first use
@@ -83,29 +112,33 @@ def process_question(question, chat_history):
             responses = []
             agents_used = []
             
-            # Call appropriate agents
+            # Call appropriate agents concurrently, each with its own deadline
+            calls = {}
             for agent_name in agents_to_use:
-                try:
-                    if agent_name.lower() in ['web', 'web_search'] or 'web' in agent_name.lower():
-                        response = web_search.search(question)
-                        responses.append(f"**Web Search:** {response}")
-                        agents_used.append("Web Search")
-                        
-                    elif agent_name.lower() in ['arxiv', 'research'] or 'arxiv' in agent_name.lower():
-                        response = arxiv_agent.search_papers(question)
-                        responses.append(f"**ArXiv Research:** {response}")
-                        agents_used.append("ArXiv")
-                        
-                    elif agent_name.lower() in ['pdf', 'rag'] or 'pdf' in agent_name.lower():
-                        if has_pdf:
-                            response = pdf_rag.query(question)
-                            responses.append(f"**PDF Documents:** {response}")
-                            agents_used.append("PDF RAG")
-                        else:
-                            responses.append("**PDF Documents:** No PDFs uploaded yet.")
-                            
-                except Exception as e:
-                    responses.append(f"**Error with {agent_name}:** {str(e)}")
+                canonical_name = canonical_agent_name(agent_name)
+                if canonical_name == 'WEB_SEARCH':
+                    calls['WEB_SEARCH'] = partial(web_search.search, question)
+                elif canonical_name == 'ARXIV':
+                    calls['ARXIV'] = partial(arxiv_agent.search_papers, question)
+                elif canonical_name == 'PDF_RAG':
+                    if has_pdf:
+                        calls['PDF_RAG'] = partial(pdf_rag.query, question)
+                    else:
+                        responses.append("**PDF Documents:** No PDFs uploaded yet.")
+            
+            # Show each agent's answer as soon as it arrives
+            waiting = len(calls)
+            for agent_name, result in executor.iter_run(calls):
+                waiting -= 1
+                if not result.ok:
+                    responses.append(f"**Error with {agent_name}:** {result.error}")
+                else:
+                    heading, label = AGENT_LABELS[agent_name]
+                    responses.append(f"**{heading}:** {result.output}")
+                    agents_used.append(label)
+                if waiting:
+                    chat_history[-1]["content"] = "\n\n".join(responses) + f"\n\n⏳ Waiting for {waiting} more agent(s)..."
+                    yield chat_history, ""
             
             if not responses:
                 # Default to web search
@@ -129,17 +162,12 @@ def process_question(question, chat_history):
             else:
                 final_answer = SimpleAgents.web_search(question)
         
-        # Update chat history
-        chat_history.append({"role": "user", "content": question})
-        chat_history.append({"role": "assistant", "content": final_answer})
-        
-        return chat_history, ""
+        chat_history[-1]["content"] = final_answer
+        yield chat_history, ""
         
     except Exception as e:
-        error_message = f"❌ Error processing question: {str(e)}"
-        chat_history.append({"role": "user", "content": question})
-        chat_history.append({"role": "assistant", "content": error_message})
-        return chat_history, ""
+        chat_history[-1]["content"] = f"❌ Error processing question: {str(e)}"
+        yield chat_history, ""
 
 def upload_pdf(pdf_file):
     """Handle PDF upload with robust error handling"""
@@ -150,18 +178,15 @@ def upload_pdf(pdf_file):
         if initialize_agents() and hasattr(pdf_rag, 'add_pdf'):
             # Use real PDF agent
             filename = os.path.basename(pdf_file.name)
-            upload_path = os.path.join('uploads', filename)
-            
-            # Ensure uploads directory exists
-            os.makedirs('uploads', exist_ok=True)
+            saved_path = upload_path('uploads', filename)
             
             # Copy file
             import shutil
-            shutil.copy2(pdf_file.name, upload_path)
+            shutil.copy2(pdf_file.name, saved_path)
             
-            # Process with PDF agent
-            pdf_rag.add_pdf(upload_path)
-            return f"✅ Successfully uploaded and processed: {filename}"
+            # Index in the background so large files don't hold up the UI
+            job = ingest_jobs.submit(saved_path)
+            return f"⏳ Uploaded {filename}, indexing in the background (job {job['id']}). It becomes searchable once indexing finishes."
         else:
             return "⚠️ PDF processing not available in demo mode"
             
@@ -264,6 +289,8 @@ from flask_cors import CORS
 
 flask_app = Flask(__name__, static_folder='frontend', static_url_path='')
 CORS(flask_app, origins=['*'])
+# Per-route request metrics and /metrics
+instrument(flask_app, lambda: {"pdf_rag": pdf_rag, "admission": admission, "llm_cache": get_gemini().cache})
 
 @flask_app.route('/')
 def serve_html():
@@ -286,22 +313,26 @@ def upload_pdf_flask():
         initialize_agents()
         
         if pdf_rag and hasattr(pdf_rag, 'add_pdf'):
-            # Ensure uploads directory exists
-            os.makedirs('uploads', exist_ok=True)
-            
             # Save file
-            filename = file.filename
-            upload_path = os.path.join('uploads', filename)
-            file.save(upload_path)
+            filename = os.path.basename(file.filename)
+            saved_path = upload_path('uploads', filename)
+            file.save(saved_path)
             
-            # Process with PDF agent
-            result = pdf_rag.add_pdf(upload_path)
+            # Index in the background; the client polls /jobs/<job_id>
+            try:
+                job = ingest_jobs.submit(saved_path)
+            except JobQueueFull as e:
+                response = jsonify({"error": str(e)})
+                response.headers['Retry-After'] = '10'
+                return response, 503
             
             return jsonify({
-                "message": f"✅ Successfully uploaded and processed: {filename}",
+                "message": f"⏳ Uploaded {filename}, indexing in the background",
                 "filename": filename,
+                "job_id": job["id"],
+                "status_url": f"/jobs/{job['id']}",
                 "success": True
-            })
+            }), 202
         else:
             return jsonify({
                 "message": "⚠️ PDF processing not available in demo mode",
@@ -311,6 +342,16 @@ def upload_pdf_flask():
     except Exception as e:
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+@flask_app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_flask(job_id):
+    job = ingest_jobs.get(job_id) if ingest_jobs else None
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+# Bounds concurrent /ask work and queueing, with per-client rate limits
+admission = AdmissionController()
+
 @flask_app.route('/ask', methods=['POST'])
 def ask_flask():
     data = request.get_json()
@@ -319,6 +360,13 @@ def ask_flask():
     if not query:
         return jsonify({"error": "No query provided"}), 400
     
+    try:
+        ticket = admission.acquire(client_id(request))
+    except Rejected as e:
+        response = jsonify({"error": str(e), "retry_after": e.retry_after, "queue": admission.stats()})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    
     try:
         # Initialize agents if not already done
         initialize_agents()
@@ -335,31 +383,32 @@ def ask_flask():
             decision = {"agents": ["WEB_SEARCH"], "reasoning": "Fallback mode"}
             agents_called = ["WEB_SEARCH"]
         
-        agent_responses = {}
-        
-        # Call appropriate agents
+        # Call appropriate agents concurrently, each with its own deadline
+        calls = {}
         for agent_name in agents_called:
-            try:
-                if agent_name == 'PDF_RAG' and pdf_rag:
-                    agent_responses['PDF_RAG'] = pdf_rag.query(query)
-                elif agent_name == 'WEB_SEARCH' and web_search:
-                    agent_responses['WEB_SEARCH'] = web_search.search(query)
-                elif agent_name == 'ARXIV' and arxiv_agent:
-                    agent_responses['ARXIV'] = arxiv_agent.search_papers(query)
-                else:
-                    # Use fallback
-                    if agent_name == 'PDF_RAG':
-                        agent_responses['PDF_RAG'] = SimpleAgents.pdf_query(query)
-                    elif agent_name == 'WEB_SEARCH':
-                        agent_responses['WEB_SEARCH'] = SimpleAgents.web_search(query)
-                    elif agent_name == 'ARXIV':
-                        agent_responses['ARXIV'] = SimpleAgents.arxiv_search(query)
-            except Exception as e:
-                agent_responses[agent_name] = {"error": str(e)}
+            if agent_name == 'PDF_RAG' and pdf_rag:
+                calls['PDF_RAG'] = partial(pdf_rag.query, query)
+            elif agent_name == 'WEB_SEARCH' and web_search:
+                calls['WEB_SEARCH'] = partial(web_search.search, query)
+            elif agent_name == 'ARXIV' and arxiv_agent:
+                calls['ARXIV'] = partial(arxiv_agent.search_papers, query)
+            else:
+                # Use fallback
+                if agent_name == 'PDF_RAG':
+                    calls['PDF_RAG'] = partial(SimpleAgents.pdf_query, query)
+                elif agent_name == 'WEB_SEARCH':
+                    calls['WEB_SEARCH'] = partial(SimpleAgents.web_search, query)
+                elif agent_name == 'ARXIV':
+                    calls['ARXIV'] = partial(SimpleAgents.arxiv_search, query)
+        
+        agent_responses = executor.run(calls)
         
         # Synthesize final answer
         if agent_responses:
-            context = "\n\n".join([f"{k}: {v}" for k, v in agent_responses.items()])
+            context = "\n\n".join(
+                f"{name}: {result.output if result.ok else 'Error - ' + result.error}"
+                for name, result in agent_responses.items()
+            )
             final_answer = f"Based on the analysis:\n\n{context}"
         else:
             final_answer = "No agents were able to process your query."
@@ -368,8 +417,9 @@ def ask_flask():
             "query": query,
             "decision": decision,
             "agents_used": agents_called,
-            "agent_responses": agent_responses,
+            "agent_responses": to_jsonable(agent_responses),
             "final_answer": final_answer,
+            "queue": {"wait_ms": ticket.wait_ms, "depth": ticket.queue_depth},
             "timestamp": datetime.now().isoformat()
         }
         
@@ -377,12 +427,20 @@ def ask_flask():
         
     except Exception as e:
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+    finally:
+        admission.release(ticket)
+
+log_reader = RequestLogReader('logs')
 
 @flask_app.route('/logs', methods=['GET'])
 def get_logs_flask():
+    # ?limit=&cursor=&since=&until=&agent=&has_pdf=&error=, newest first
+    try:
+        filters = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
     try:
-        import json
-        
         # Get controller logs if available
         controller_logs = []
         if agents_loaded and controller and hasattr(controller, 'get_logs'):
@@ -391,20 +449,13 @@ def get_logs_flask():
             except:
                 controller_logs = []
         
-        # Get request logs from files
-        request_logs = []
-        if os.path.exists('logs'):
-            log_files = [f for f in os.listdir('logs') if f.endswith('.json')]
-            for log_file in sorted(log_files, reverse=True)[:5]:
-                try:
-                    with open(os.path.join('logs', log_file), 'r') as f:
-                        request_logs.extend(json.load(f))
-                except:
-                    continue
+        # Get request logs from the log segments, newest first
+        request_logs, next_cursor = log_reader.page(**filters)
         
         return jsonify({
             "controller_logs": controller_logs,
-            "request_logs": request_logs[-50:]  # Last 50 entries
+            "request_logs": request_logs,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
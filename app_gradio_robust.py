@@ -1,7 +1,9 @@
 import gradio as gr
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+from agents.gemini_client import get_gemini
+from functools import partial
+from agents.orchestrator import AgentExecutor, canonical_agent_name
 
 # Load environment variables
 load_dotenv()
@@ -9,11 +11,21 @@ load_dotenv()
 # Configure Gemini
 api_key = os.environ.get("GEMINI_API_KEY")
 if api_key:
-    genai.configure(api_key=api_key)
+    get_gemini().configure()
     print("✅ Gemini API configured")
 else:
     print("⚠️ Warning: GEMINI_API_KEY not found")
 
+# Agents chosen by the controller run concurrently on this executor
+executor = AgentExecutor()
+
+# Response heading and "Agents Used" label for each canonical agent name
+AGENT_LABELS = {
+    'WEB_SEARCH': ("Web Search", "Web Search"),
+    'ARXIV': ("ArXiv Research", "ArXiv"),
+    'PDF_RAG': ("PDF Documents", "PDF RAG"),
+}
+
 # Simple fallback implementations for when agents fail
 class SimpleAgents:
     @staticmethod
@@ -37,11 +49,13 @@ try:
     from agents.pdf_rag_agent import PDFRAGAgent
     from agents.web_search_agent import WebSearchAgent
     from agents.arxiv_agent import ArxivAgent
+    from agents.ingest_jobs import IngestionJobQueue, upload_path
     
     controller = ControllerAgent()
     pdf_rag = PDFRAGAgent()
     web_search = WebSearchAgent()
     arxiv_agent = ArxivAgent()
+    ingest_jobs = IngestionJobQueue(pdf_rag)
     
     agents_loaded = True
     print("✅ All agents loaded successfully")
@@ -51,9 +65,18 @@ except Exception as e:
     agents_loaded = False
 
 def process_question(question, chat_history):
-    """Process user question with robust error handling"""
+    """Process user question with robust error handling.
+    
+    A generator: the chat is updated as each agent finishes instead of once
+    every agent has answered.
+    """
     if not question.strip():
-        return chat_history, ""
+        yield chat_history, ""
+        return
+    
+    chat_history.append({"role": "user", "content": question})
+    chat_history.append({"role": "assistant", "content": "⏳ Consulting agents..."})
+    yield chat_history, ""
     
     try:
         if agents_loaded:
@@ -67,29 +90,33 @@ def process_question(question, chat_history):
             responses = []
             agents_used = []
             
-            # Call appropriate agents
+            # Call appropriate agents concurrently, each with its own deadline
+            calls = {}
             for agent_name in agents_to_use:
-                try:
-                    if agent_name.lower() in ['web', 'web_search'] or 'web' in agent_name.lower():
-                        response = web_search.search(question)
-                        responses.append(f"**Web Search:** {response}")
-                        agents_used.append("Web Search")
-                        
-                    elif agent_name.lower() in ['arxiv', 'research'] or 'arxiv' in agent_name.lower():
-                        response = arxiv_agent.search_papers(question)
-                        responses.append(f"**ArXiv Research:** {response}")
-                        agents_used.append("ArXiv")
-                        
-                    elif agent_name.lower() in ['pdf', 'rag'] or 'pdf' in agent_name.lower():
-                        if has_pdf:
-                            response = pdf_rag.query(question)
-                            responses.append(f"**PDF Documents:** {response}")
-                            agents_used.append("PDF RAG")
-                        else:
-                            responses.append("**PDF Documents:** No PDFs uploaded yet.")
-                            
-                except Exception as e:
-                    responses.append(f"**Error with {agent_name}:** {str(e)}")
+                canonical_name = canonical_agent_name(agent_name)
+                if canonical_name == 'WEB_SEARCH':
+                    calls['WEB_SEARCH'] = partial(web_search.search, question)
+                elif canonical_name == 'ARXIV':
+                    calls['ARXIV'] = partial(arxiv_agent.search_papers, question)
+                elif canonical_name == 'PDF_RAG':
+                    if has_pdf:
+                        calls['PDF_RAG'] = partial(pdf_rag.query, question)
+                    else:
+                        responses.append("**PDF Documents:** No PDFs uploaded yet.")
+            
+            # Show each agent's answer as soon as it arrives
+            waiting = len(calls)
+            for agent_name, result in executor.iter_run(calls):
+                waiting -= 1
+                if not result.ok:
+                    responses.append(f"**Error with {agent_name}:** {result.error}")
+                else:
+                    heading, label = AGENT_LABELS[agent_name]
+                    responses.append(f"**{heading}:** {result.output}")
+                    agents_used.append(label)
+                if waiting:
+                    chat_history[-1]["content"] = "\n\n".join(responses) + f"\n\n⏳ Waiting for {waiting} more agent(s)..."
+                    yield chat_history, ""
             
             if not responses:
                 # Default to web search
@@ -113,17 +140,12 @@ def process_question(question, chat_history):
             else:
                 final_answer = SimpleAgents.web_search(question)
         
-        # Update chat history
-        chat_history.append({"role": "user", "content": question})
-        chat_history.append({"role": "assistant", "content": final_answer})
-        
-        return chat_history, ""
+        chat_history[-1]["content"] = final_answer
+        yield chat_history, ""
         
     except Exception as e:
-        error_message = f"❌ Error processing question: {str(e)}"
-        chat_history.append({"role": "user", "content": question})
-        chat_history.append({"role": "assistant", "content": error_message})
-        return chat_history, ""
+        chat_history[-1]["content"] = f"❌ Error processing question: {str(e)}"
+        yield chat_history, ""
 
 def upload_pdf(pdf_file):
     """Handle PDF upload with robust error handling"""
@@ -134,18 +156,15 @@ def upload_pdf(pdf_file):
         if agents_loaded and hasattr(pdf_rag, 'add_pdf'):
             # Use real PDF agent
             filename = os.path.basename(pdf_file.name)
-            upload_path = os.path.join('uploads', filename)
-            
-            # Ensure uploads directory exists
-            os.makedirs('uploads', exist_ok=True)
+            saved_path = upload_path('uploads', filename)
             
             # Copy file
             import shutil
-            shutil.copy2(pdf_file.name, upload_path)
+            shutil.copy2(pdf_file.name, saved_path)
             
-            # Process with PDF agent
-            pdf_rag.add_pdf(upload_path)
-            return f"✅ Successfully uploaded and processed: {filename}"
+            # Index in the background so large files don't hold up the UI
+            job = ingest_jobs.submit(saved_path)
+            return f"⏳ Uploaded {filename}, indexing in the background (job {job['id']}). It becomes searchable once indexing finishes."
         else:
             return "⚠️ PDF processing not available in demo mode"
             
@@ -1,33 +1,235 @@
+#!/usr/bin/env python3
+"""
+Bulk-ingest PDFs into the PDF RAG agent's persistent index.
+
+Walks the given files and directory trees, then extracts, chunks and embeds
+the PDFs across a process pool and appends them to the index under
+--index-path. Every finished file is recorded in a manifest, so an
+interrupted run over thousands of PDFs resumes where it stopped.
+
+Usage:
+    python ingest_sample_pdfs.py                      # sample_pdfs/, category NebulaByte
+    python ingest_sample_pdfs.py docs/ papers/ --workers 8 --metadata category=research
+    python ingest_sample_pdfs.py archive/ --metadata-file archive/metadata.json
+
+--metadata-file is a JSON object mapping a file path (absolute, relative to
+the working directory, or just the file name) to that file's metadata.
+"""
 import os
-from agents.pdf_rag_agent import PDFRAGAgent
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from agents.pdf_rag_agent import PDFRAGAgent, prepare_document, DEFAULT_INDEX_PATH
+from agents.ingest_cache import IngestionCache, file_sha256
+from agents.gemini_client import DEFAULT_RPM, DEFAULT_TPM
+
+SAMPLE_PDFS_DIR = 'sample_pdfs'
+
+
+def find_pdfs(paths):
+    pdf_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            if path.lower().endswith('.pdf'):
+                pdf_files.append(os.path.abspath(path))
+            continue
+        for root, _, files in os.walk(path):
+            for name in files:
+                if name.lower().endswith('.pdf'):
+                    pdf_files.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(set(pdf_files))
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
 
-rag_agent = PDFRAGAgent()
 
-sample_pdfs_dir = 'sample_pdfs'
+def load_manifest(manifest_path):
+    """Return the latest manifest entry for every path, keyed by absolute path."""
+    entries = {}
+    if not os.path.exists(manifest_path):
+        return entries
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a torn last line
+                continue
+            entries[entry["path"]] = entry
+    return entries
 
-if not os.path.exists(sample_pdfs_dir):
-    print(f"Error: {sample_pdfs_dir} directory not found.")
-    print("Please run generate_sample_pdfs.py first.")
-    exit(1)
 
-pdf_files = [f for f in os.listdir(sample_pdfs_dir) if f.endswith('.pdf')]
+def is_finished(entry, path):
+    return (entry is not None and entry["status"] in ("done", "duplicate", "empty")
+            and {"size": entry["size"], "mtime_ns": entry["mtime_ns"]} == file_signature(path))
 
-if not pdf_files:
-    print(f"No PDF files found in {sample_pdfs_dir}")
-    exit(1)
 
-print(f"Found {len(pdf_files)} PDF files. Starting ingestion...\n")
+def metadata_for(path, base_metadata, per_file_metadata):
+    metadata = dict(base_metadata)
+    for key in (path, os.path.relpath(path), os.path.basename(path)):
+        if key in per_file_metadata:
+            metadata.update(per_file_metadata[key])
+            break
+    return metadata
 
-for pdf_file in pdf_files:
-    pdf_path = os.path.join(sample_pdfs_dir, pdf_file)
-    print(f"Ingesting: {pdf_file}")
-    
+
+def init_worker(rpm, tpm):
+    """Worker initializer: each process gets its own GeminiClient, so give
+    each an equal share of the project quota instead of all of it."""
+    os.environ["GEMINI_RPM"] = str(rpm)
+    os.environ["GEMINI_TPM"] = str(tpm)
+
+
+def worker_quota(total, workers):
+    # 0 means unlimited; otherwise at least one unit per worker
+    return max(1, total // workers) if total > 0 else 0
+
+
+def prepare(path, cache_dir, chunk_size, chunk_overlap, extract_backend):
+    """Worker: hash, extract, chunk and embed one PDF."""
     try:
-        result = rag_agent.ingest_pdf(pdf_path, metadata={"category": "NebulaByte"})
-        print(f"  ✓ {result}")
+        digest = file_sha256(path)
+        chunks, vectors, _, pages = prepare_document(
+            path, digest, IngestionCache(cache_dir), chunk_size, chunk_overlap,
+            extract_backend, parallel=False
+        )
+        return {"path": path, "sha256": digest, "chunks": chunks, "vectors": vectors, "pages": pages}
     except Exception as e:
-        print(f"  ✗ Error: {str(e)}")
-    print()
+        return {"path": path, "error": str(e)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into the PDF RAG index")
+    parser.add_argument('paths', nargs='*', help="PDF files or directories to walk (default: sample_pdfs)")
+    parser.add_argument('--index-path', default=DEFAULT_INDEX_PATH,
+                        help=f"PDFRAGAgent index_path (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument('--manifest', help="Progress manifest (default: <index-path>.manifest.jsonl)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument('--batch-size', type=int, default=16, help="Documents appended per index write")
+    parser.add_argument('--backend', help="PDF extraction backend (pymupdf or pypdf2)")
+    parser.add_argument('--metadata', action='append', default=[], metavar='KEY=VALUE',
+                        help="Metadata attached to every document, e.g. category=NebulaByte")
+    parser.add_argument('--metadata-file', help="JSON object of per-file metadata")
+    return parser.parse_args()
+
+
+def main():
+    load_dotenv()
+    args = parse_args()
+
+    paths = args.paths
+    base_metadata = dict(item.split('=', 1) for item in args.metadata)
+    if not paths:
+        if not os.path.exists(SAMPLE_PDFS_DIR):
+            print(f"Error: {SAMPLE_PDFS_DIR} directory not found.")
+            print("Please run generate_sample_pdfs.py first.")
+            sys.exit(1)
+        paths = [SAMPLE_PDFS_DIR]
+        base_metadata.setdefault("category", "NebulaByte")
+
+    per_file_metadata = {}
+    if args.metadata_file:
+        with open(args.metadata_file, 'r') as f:
+            per_file_metadata = json.load(f)
+
+    rag_agent = PDFRAGAgent(index_path=args.index_path, extract_backend=args.backend)
+    manifest_path = args.manifest or f"{args.index_path}.manifest.jsonl"
+    manifest = load_manifest(manifest_path)
+
+    pdf_files = find_pdfs(paths)
+    if not pdf_files:
+        print(f"No PDF files found in {', '.join(paths)}")
+        sys.exit(1)
+    pending = [path for path in pdf_files if not is_finished(manifest.get(path), path)]
+
+    print(f"Found {len(pdf_files)} PDF files, {len(pdf_files) - len(pending)} already ingested "
+          f"(manifest: {manifest_path}). Ingesting {len(pending)} with {args.workers} workers...\n")
+
+    start_time = time.monotonic()
+    totals = {"files": 0, "pages": 0, "chunks": 0, "errors": 0}
+    batch = []
+
+    def record(entry):
+        with open(manifest_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def flush():
+        # Index first, manifest second: a crash in between only means the
+        # batch is re-checked (and skipped as duplicates) on the next run
+        added = rag_agent.add_documents(batch)
+        for doc, was_added in zip(batch, added):
+            status = "done" if was_added else "duplicate"
+            record(dict(file_signature(doc["path"]), path=doc["path"], status=status,
+                        sha256=doc["sha256"], pages=doc["pages"], chunks=len(doc["chunks"])))
+        batch.clear()
+
+    def report(result):
+        elapsed = max(time.monotonic() - start_time, 1e-9)
+        print(f"[{totals['files']}/{len(pending)}] {os.path.relpath(result['path'])}: "
+              f"{result.get('pages', 0)} pages, {len(result.get('chunks') or [])} chunks | "
+              f"{totals['pages'] / elapsed:.1f} pages/s, {totals['chunks'] / elapsed:.1f} chunks/s")
+
+    # Spawned workers start clean instead of inheriting the parent's client state
+    context = multiprocessing.get_context('spawn')
+    rpm = worker_quota(int(os.environ.get("GEMINI_RPM", DEFAULT_RPM)), args.workers)
+    tpm = worker_quota(int(os.environ.get("GEMINI_TPM", DEFAULT_TPM)), args.workers)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=init_worker, initargs=(rpm, tpm)) as pool:
+        queue = iter(pending)
+        in_flight = set()
+        while True:
+            # Keep a bounded number of files in flight so results holding
+            # embeddings don't pile up in memory
+            while len(in_flight) < args.workers * 2:
+                path = next(queue, None)
+                if path is None:
+                    break
+                in_flight.add(pool.submit(prepare, path, rag_agent.cache.cache_dir,
+                                          rag_agent.chunk_size, rag_agent.chunk_overlap, args.backend))
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                totals["files"] += 1
+                if "error" in result:
+                    totals["errors"] += 1
+                    record(dict(file_signature(result["path"]), path=result["path"],
+                                status="error", error=result["error"]))
+                    print(f"  ✗ {os.path.relpath(result['path'])}: {result['error']}")
+                    continue
+
+                totals["pages"] += result["pages"]
+                totals["chunks"] += len(result["chunks"])
+                report(result)
+                if not result["chunks"]:
+                    record(dict(file_signature(result["path"]), path=result["path"],
+                                status="empty", sha256=result["sha256"]))
+                    continue
+
+                result["filename"] = os.path.basename(result["path"])
+                result["metadata"] = metadata_for(result["path"], base_metadata, per_file_metadata)
+                batch.append(result)
+                if len(batch) >= args.batch_size:
+                    flush()
+
+    if batch:
+        flush()
+
+    elapsed = time.monotonic() - start_time
+    print("\nIngestion complete!")
+    print(f"Processed {totals['files']} files ({totals['errors']} errors) in {elapsed:.1f}s: "
+          f"{totals['pages'] / max(elapsed, 1e-9):.1f} pages/s, {totals['chunks'] / max(elapsed, 1e-9):.1f} chunks/s")
+    print(f"Total documents in index: {len(rag_agent.documents)} ({rag_agent.index.ntotal} chunks)")
+
 
-print("Ingestion complete!")
-print(f"Total documents in index: {rag_agent.index.ntotal if rag_agent.index else 0}")
+if __name__ == '__main__':
+    main()
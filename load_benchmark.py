@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the Flask app against local stand-ins for
+DuckDuckGo, arXiv and Gemini (see stub_servers.py).
+
+Starts the stubs, starts the app in a scratch directory (fresh index,
+caches and logs) pointed at them, then drives each scenario at each
+concurrency level and reports p50/p95/p99 latency, throughput and error
+rates. Scenarios pick the agent mix through the router's keywords:
+
+    web     WEB_SEARCH only            arxiv   ARXIV only
+    pdf     PDF_RAG only               mixed   all three agents
+    upload  /upload_pdf, timed until the indexing job finishes
+
+Save a run with --output and compare a later one against it with --compare:
+
+    python load_benchmark.py --concurrency 1,8,32 --output before.json
+    python load_benchmark.py --concurrency 1,8,32 --compare before.json
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from stub_servers import add_stub_arguments, start_stubs, stub_environment
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Topics avoid every routing keyword so the template alone picks the agents
+TOPICS = ["graph neural networks", "protein folding", "battery chemistry", "speech recognition",
+          "quantum error correction", "reinforcement learning", "climate modelling", "compilers"]
+
+SCENARIOS = {
+    "web": "latest news on {topic}",
+    "arxiv": "research papers on {topic}",
+    "pdf": "summarize the uploaded pdf on {topic}",
+    "mixed": "latest research papers and the uploaded pdf on {topic}",
+    "upload": None,
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def make_pdf(n):
+    """A small PDF whose text is unique to ``n``, so ingestion never dedupes it."""
+    import fitz
+    doc = fitz.open()
+    for page_no in range(3):
+        page = doc.new_page()
+        text = f"Benchmark document {n}, page {page_no + 1}.\n" + (
+            f"Section on {TOPICS[(n + page_no) % len(TOPICS)]} with filler text for chunking. " * 40)
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class AppServer:
+    """The app under test, run as a subprocess in a scratch directory."""
+
+    def __init__(self, module, port, env):
+        self.module = module
+        self.port = port
+        self.env = env
+        self.workdir = tempfile.mkdtemp(prefix="loadbench-")
+        self.process = None
+        self.log_path = os.path.join(self.workdir, "server.log")
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=120):
+        env = dict(os.environ, **self.env)
+        env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+        os.makedirs(os.path.join(self.workdir, "uploads"), exist_ok=True)
+        code = (f"from {self.module} import app; "
+                f"app.run(host='127.0.0.1', port={self.port}, threaded=True, debug=False)")
+        self.log = open(self.log_path, "w")
+        self.process = subprocess.Popen([sys.executable, "-c", code], cwd=self.workdir, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"App exited with code {self.process.returncode}, see {self.log_path}")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"App did not become healthy within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process:
+            self.log.close()
+
+
+class LoadRunner:
+    def __init__(self, base_url, distinct_queries=0, request_timeout=120, job_timeout=300):
+        self.base_url = base_url
+        self.distinct_queries = distinct_queries
+        self.request_timeout = request_timeout
+        self.job_timeout = job_timeout
+        self.local = threading.local()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def question(self, scenario, n):
+        if self.distinct_queries:
+            # A small repeating pool exercises the caches and coalescing
+            n %= self.distinct_queries
+        topic = TOPICS[n % len(TOPICS)]
+        return SCENARIOS[scenario].format(topic=f"{topic} {n}")
+
+    def ask(self, scenario, n):
+        """POST /ask; returns ``(status, agent_results, agent_errors)``."""
+        question = self.question(scenario, n)
+        # app.py reads "query", app_flask.py reads "question"
+        response = self.session().post(f"{self.base_url}/ask", json={"query": question, "question": question},
+                                       timeout=self.request_timeout)
+        if response.status_code != 200:
+            return response.status_code, 0, 0
+        agent_responses = response.json().get("agent_responses") or {}
+        failed = sum(1 for result in agent_responses.values() if isinstance(result, dict) and result.get("error"))
+        return 200, len(agent_responses), failed
+
+    def upload(self, n, wait=True):
+        """POST /upload_pdf and poll the job until it finishes."""
+        files = {"file": (f"bench_{os.getpid()}_{n}.pdf", make_pdf(n), "application/pdf")}
+        response = self.session().post(f"{self.base_url}/upload_pdf", files=files, timeout=self.request_timeout)
+        if response.status_code != 202 or not wait:
+            return response.status_code, 0, 0
+
+        status_url = f"{self.base_url}{response.json()['status_url']}"
+        deadline = time.monotonic() + self.job_timeout
+        while time.monotonic() < deadline:
+            job = self.session().get(status_url, timeout=self.request_timeout).json()
+            if job.get("status") == "done":
+                return 200, 1, 0
+            if job.get("status") == "error":
+                return "job_error", 1, 1
+            time.sleep(0.05)
+        return 504, 1, 1
+
+    def one(self, scenario):
+        n = next(self.counter)
+        start = time.monotonic()
+        try:
+            if scenario == "upload":
+                status, agents, agent_errors = self.upload(n)
+            else:
+                status, agents, agent_errors = self.ask(scenario, n)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            status, agents, agent_errors = type(e).__name__, 0, 0
+        return time.monotonic() - start, status, agents, agent_errors
+
+    def run_level(self, scenario, concurrency, total):
+        """Closed loop: ``concurrency`` clients send ``total`` requests
+        between them, each sending its next as soon as the last returns."""
+        samples = []
+        remaining = [total]
+
+        def client():
+            while True:
+                with self.lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                sample = self.one(scenario)
+                with self.lock:
+                    samples.append(sample)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(client)
+        return summarize(scenario, concurrency, samples, time.monotonic() - start)
+
+
+def summarize(scenario, concurrency, samples, elapsed):
+    # Latency percentiles cover successful requests only; fast rejections
+    # would otherwise flatter them
+    latencies = sorted(latency for latency, status, _, _ in samples if status == 200)
+    statuses = {}
+    for _, status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    agents = sum(sample[2] for sample in samples)
+    agent_errors = sum(sample[3] for sample in samples)
+    failed = len(samples) - len(latencies)
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "ok": len(latencies),
+        "rejected": statuses.get("429", 0) + statuses.get("503", 0),
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "agent_error_rate": round(agent_errors / agents, 4) if agents else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def print_results(results, baseline=None):
+    previous = {(r["scenario"], r["concurrency"]): r for r in (baseline or {}).get("results", [])}
+    header = f"{'scenario':<8} {'conc':>4} {'reqs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>7} {'err%':>6} {'agent err%':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<8} {r['concurrency']:>4} {r['requests']:>5} "
+              f"{_fmt(r['p50_ms']):>9} {_fmt(r['p95_ms']):>9} {_fmt(r['p99_ms']):>9} "
+              f"{r['throughput_rps']:>7.2f} {r['error_rate'] * 100:>6.1f} {r['agent_error_rate'] * 100:>10.1f}")
+        before = previous.get((r["scenario"], r["concurrency"]))
+        if before:
+            print(f"{'  vs':<8} {'':>4} {'':>5} "
+                  f"{_delta(before['p50_ms'], r['p50_ms']):>9} {_delta(before['p95_ms'], r['p95_ms']):>9} "
+                  f"{_delta(before['p99_ms'], r['p99_ms']):>9} {_delta(before['throughput_rps'], r['throughput_rps']):>7} "
+                  f"{(r['error_rate'] - before['error_rate']) * 100:>+6.1f}")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _delta(before, after):
+    if not before or after is None:
+        return "-"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /ask and /upload_pdf against local stub upstreams")
+    parser.add_argument("--app", choices=["app", "app_flask"], default="app", help="Flask module to benchmark")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenarios", default="web,arxiv,pdf,mixed,upload",
+                        help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario and level")
+    parser.add_argument("--distinct-queries", type=int, default=0,
+                        help="cycle this many distinct questions (0: every question unique, caches stay cold)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    stubs = start_stubs(args)
+    env = stub_environment(stubs)
+    # One client address sends everything, and the Gemini quotas would
+    # measure the token buckets rather than the app; both can still be
+    # set explicitly
+    for key, value in (("ASK_CLIENT_RATE", "0"), ("GEMINI_RPM", "0"), ("GEMINI_TPM", "0")):
+        env[key] = os.environ.get(key, value)
+    app = AppServer(args.app, args.port, env)
+    print(f"Starting {args.app} in {app.workdir} ...")
+    app.start()
+
+    results = []
+    try:
+        runner = LoadRunner(app.url, args.distinct_queries)
+        if any(name in ("pdf", "mixed") for name in scenarios):
+            # The PDF agent only runs once a document is indexed
+            status, _, failed = runner.upload(next(runner.counter))
+            if status != 200 or failed:
+                print(f"Warning: seeding a PDF failed (status {status}); pdf scenarios will fall back to web search")
+
+        for scenario in scenarios:
+            for level in levels:
+                print(f"Running {scenario} at concurrency {level} ...")
+                results.append(runner.run_level(scenario, level, args.requests))
+    finally:
+        app.stop()
+        for stub in stubs.values():
+            stub.stop()
+
+    print()
+    print_results(results, baseline)
+    upstream = {name: stub.stats() for name, stub in stubs.items()}
+    print("\nUpstream requests: " + ", ".join(
+        f"{name} {stats['requests']} ({stats['errors']} injected errors)" for name, stats in upstream.items()))
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "revision": git_revision(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "results": results,
+            "upstream": upstream,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
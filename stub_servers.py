@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for DuckDuckGo HTML search, the arXiv Atom API and the
+Gemini REST API, for load benchmarks that should not touch (or pay for)
+the real services.
+
+Each stub answers after a configurable latency (plus or minus jitter) and
+fails a configurable fraction of requests with a 503. Responses are shaped
+like the real ones closely enough for the agents' parsers and the Gemini
+SDK's REST transport.
+
+Run directly to start all three and print the environment variables that
+point the app at them:
+
+    python stub_servers.py --gemini-latency 0.8 --ddg-errors 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+EMBEDDING_DIM = 768
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.stub.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.stub.handle(self, "POST")
+
+    def log_message(self, format, *args):
+        # Thousands of requests per run: keep the console quiet
+        pass
+
+
+class StubServer:
+    """A threaded HTTP server on 127.0.0.1 with injected latency and errors.
+    Subclasses implement ``respond(method, path, query, body)`` and return
+    ``(status, content_type, payload)``."""
+
+    name = "stub"
+
+    def __init__(self, latency=0.1, jitter=None, error_rate=0.0, port=0):
+        self.latency = latency
+        self.jitter = jitter if jitter is not None else latency / 4
+        self.error_rate = error_rate
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors}
+
+    def handle(self, handler, method):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        parsed = urlparse(handler.path)
+
+        delay = random.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        time.sleep(max(0.0, delay))
+
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+        if failed:
+            status, content_type, payload = 503, "text/plain", b"injected failure"
+        else:
+            try:
+                status, content_type, payload = self.respond(method, parsed.path, parse_qs(parsed.query), body)
+            except Exception as e:
+                status, content_type, payload = 500, "text/plain", str(e).encode()
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def respond(self, method, path, query, body):
+        raise NotImplementedError
+
+
+class DuckDuckGoStub(StubServer):
+    """Serves ``/html/?q=...`` result pages in DuckDuckGo's HTML layout."""
+
+    name = "ddg"
+
+    def __init__(self, results=10, **kwargs):
+        super().__init__(**kwargs)
+        self.results = results
+
+    def respond(self, method, path, query, body):
+        q = query.get("q", [""])[0]
+        items = []
+        for i in range(self.results):
+            items.append(
+                '<div class="result results_links web-result">'
+                f'<a class="result__a" href="https://example.com/{i}?q={escape(q)}">{escape(q)} result {i + 1}</a>'
+                f'<a class="result__snippet" href="https://example.com/{i}">Snippet {i + 1} about {escape(q)}. '
+                'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</a>'
+                '</div>'
+            )
+        page = f"<html><body><div id=\"links\">{''.join(items)}</div></body></html>"
+        return 200, "text/html; charset=utf-8", page.encode()
+
+
+class ArxivStub(StubServer):
+    """Serves ``/api/query`` as an Atom feed; paper ids depend on the query,
+    so different queries do not share cached papers."""
+
+    name = "arxiv"
+
+    def respond(self, method, path, query, body):
+        search = query.get("search_query", [""])[0]
+        max_results = int(query.get("max_results", ["5"])[0])
+        prefix = hashlib.sha1(search.encode()).hexdigest()[:8]
+        entries = []
+        for i in range(max_results):
+            paper_id = f"{prefix}.{i:05d}v1"
+            entries.append(
+                "<entry>"
+                f"<id>http://arxiv.org/abs/{paper_id}</id>"
+                "<published>2024-01-15T00:00:00Z</published>"
+                f"<title>Stub paper {i + 1} on {escape(search)}</title>"
+                f"<summary>An abstract for stub paper {i + 1}. " + "We study the problem at length. " * 20 + "</summary>"
+                "<author><name>A. Author</name></author><author><name>B. Author</name></author>"
+                "</entry>"
+            )
+        feed = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<feed xmlns="http://www.w3.org/2005/Atom">' + "".join(entries) + "</feed>")
+        return 200, "application/atom+xml; charset=utf-8", feed.encode()
+
+
+class GeminiStub(StubServer):
+    """Answers ``models/*:generateContent``, ``:streamGenerateContent``,
+    ``:embedContent`` and ``:batchEmbedContents`` like the v1beta REST API.
+    Embeddings are deterministic per text."""
+
+    name = "gemini"
+
+    def __init__(self, answer_chars=600, **kwargs):
+        super().__init__(**kwargs)
+        self.answer_chars = answer_chars
+        self.prompt_chars = 0
+        self.calls = {}
+
+    def stats(self):
+        stats = super().stats()
+        with self.lock:
+            stats.update(calls=dict(self.calls), prompt_chars=self.prompt_chars)
+        return stats
+
+    def respond(self, method, path, query, body):
+        request = json.loads(body or b"{}")
+        action = path.rsplit(":", 1)[-1]
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+
+        if action == "generateContent":
+            return self._json(self._generation(request))
+        if action == "streamGenerateContent":
+            # The REST transport reads a stream as one JSON array
+            response = self._generation(request)
+            text = response["candidates"][0]["content"]["parts"][0]["text"]
+            chunks = []
+            for start in range(0, len(text), 200):
+                chunk = json.loads(json.dumps(response))
+                chunk["candidates"][0]["content"]["parts"][0]["text"] = text[start:start + 200]
+                chunks.append(chunk)
+            return self._json(chunks)
+        if action == "embedContent":
+            return self._json({"embedding": {"values": self._vector(self._text(request))}})
+        if action == "batchEmbedContents":
+            return self._json({"embeddings": [{"values": self._vector(self._text(item))}
+                                              for item in request.get("requests", [])]})
+        return 404, "application/json", json.dumps({"error": {"code": 404, "message": f"Unknown action {action}"}}).encode()
+
+    def _json(self, data):
+        return 200, "application/json", json.dumps(data).encode()
+
+    def _text(self, request):
+        parts = []
+        contents = request.get("contents") or [request.get("content") or {}]
+        for content in contents:
+            for part in content.get("parts", []):
+                parts.append(part.get("text", ""))
+        return "".join(parts)
+
+    def _generation(self, request):
+        prompt = self._text(request)
+        with self.lock:
+            self.prompt_chars += len(prompt)
+        sentence = f"This is a stub answer to a {len(prompt)}-character prompt. "
+        text = (sentence * (self.answer_chars // len(sentence) + 1))[:self.answer_chars]
+        prompt_tokens = len(prompt) // 4 + 1
+        answer_tokens = len(text) // 4 + 1
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": answer_tokens,
+                "totalTokenCount": prompt_tokens + answer_tokens
+            }
+        }
+
+    def _vector(self, text):
+        rng = random.Random(hashlib.sha1(text.encode()).digest())
+        return [rng.gauss(0, 1) for _ in range(EMBEDDING_DIM)]
+
+
+def add_stub_arguments(parser):
+    """Latency and error-rate options for the three stubs."""
+    for name, latency in (("ddg", 0.15), ("arxiv", 0.3), ("gemini", 0.8)):
+        parser.add_argument(f"--{name}-latency", type=float, default=latency,
+                            help=f"seconds per {name} response (default {latency})")
+        parser.add_argument(f"--{name}-jitter", type=float, default=None,
+                            help=f"+/- seconds of {name} latency jitter (default latency/4)")
+        parser.add_argument(f"--{name}-errors", type=float, default=0.0,
+                            help=f"fraction of {name} requests answered with a 503")
+
+
+def start_stubs(args):
+    """Start the three stubs from parsed ``add_stub_arguments`` options."""
+    stubs = {}
+    for name, cls in (("ddg", DuckDuckGoStub), ("arxiv", ArxivStub), ("gemini", GeminiStub)):
+        stubs[name] = cls(
+            latency=getattr(args, f"{name}_latency"),
+            jitter=getattr(args, f"{name}_jitter"),
+            error_rate=getattr(args, f"{name}_errors")
+        ).start()
+    return stubs
+
+
+def stub_environment(stubs):
+    """Environment variables that point the agents at the stubs."""
+    return {
+        "DDG_HTML_URL": f"{stubs['ddg'].url}/html/",
+        "ARXIV_API_URL": f"{stubs['arxiv'].url}/api/query",
+        "GEMINI_API_ENDPOINT": stubs["gemini"].url,
+        "GEMINI_API_KEY": "stub-key",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-ins for DuckDuckGo, arXiv and Gemini")
+    add_stub_arguments(parser)
+    stubs = start_stubs(parser.parse_args())
+
+    print("Stub servers running. Point the app at them with:")
+    for key, value in stub_environment(stubs).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for stub in stubs.values():
+            stub.stop()
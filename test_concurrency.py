@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrency building blocks: request coalescing, the
+quota limits shared by threads and coroutines, and /ask admission control.
+
+Run with: python -m pytest -q test_concurrency.py
+"""
+
+import time
+import asyncio
+import threading
+import pytest
+from agents.singleflight import SingleFlight
+from agents.limits import TokenBucket, Slots
+from agents.admission import AdmissionController, Rejected
+
+
+def test_singleflight_threads_share_one_call():
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("k", work))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    # Followers only count as shared once they have joined the call
+    deadline = time.monotonic() + 5
+    while flights.shared < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["answer"] * 5
+    # The key is forgotten once the call is done
+    assert flights.do("k", lambda: "fresh") == "fresh"
+
+
+def test_singleflight_shares_errors():
+    flights = SingleFlight()
+    with pytest.raises(ValueError):
+        flights.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flights.calls == {}
+
+
+def test_singleflight_async_cancelled_waiter_does_not_cancel_the_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        impatient = asyncio.ensure_future(flights.do_async("k", work))
+        patient = asyncio.ensure_future(flights.do_async("k", work))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        assert await patient == "answer"
+        assert calls == [1]
+        assert flights.tasks == {}
+
+    asyncio.run(main())
+
+
+def test_slots_cap_threads_and_coroutines_together():
+    slots = Slots(2)
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def enter():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+
+    def leave():
+        with lock:
+            active[0] -= 1
+
+    def thread_worker():
+        with slots:
+            enter()
+            time.sleep(0.01)
+            leave()
+
+    async def coroutine_worker():
+        await slots.acquire_async()
+        try:
+            enter()
+            await asyncio.sleep(0.01)
+            leave()
+        finally:
+            slots.release()
+
+    async def main():
+        threads = [threading.Thread(target=thread_worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        await asyncio.gather(*(coroutine_worker() for _ in range(10)))
+        for thread in threads:
+            await asyncio.to_thread(thread.join, 5)
+
+    asyncio.run(main())
+    assert peak[0] == 2
+    assert slots.free == 2 and not slots.waiters
+
+
+def test_slots_cancelled_waiters_give_their_slot_back():
+    async def main():
+        slots = Slots(1)
+        await slots.acquire_async()
+        waiters = [asyncio.ensure_future(slots.acquire_async()) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        slots.release()
+        # The release hands the slot over just as the first waiter is cancelled
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert waiters[2].done() and not waiters[2].cancelled()
+        slots.release()
+        assert slots.free == 1 and not slots.waiters
+
+    asyncio.run(main())
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 per second
+    bucket.tokens = 0
+    start = time.monotonic()
+    bucket.acquire(2)
+    assert 0.15 <= time.monotonic() - start < 1
+
+
+def test_token_bucket_async_waits_on_the_loop():
+    async def main():
+        bucket = TokenBucket(600)
+        bucket.tokens = 0
+        ticks = []
+
+        async def ticker():
+            while len(ticks) < 5:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.02)
+
+        start = time.monotonic()
+        await asyncio.gather(bucket.acquire_async(2), ticker())
+        # The loop kept running while the bucket refilled
+        assert len(ticks) == 5
+        assert time.monotonic() - start >= 0.15
+
+    asyncio.run(main())
+
+
+def test_token_bucket_settle_refunds_and_charges():
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    bucket.settle(-30)
+    assert 29 <= bucket.tokens <= 31
+    bucket.settle(100)
+    assert bucket.tokens < 0
+
+
+def test_admission_rate_limits_each_client():
+    admission = AdmissionController(max_concurrent=10, client_rate=60, client_burst=2)
+    tickets = [admission.acquire("a"), admission.acquire("a")]
+    with pytest.raises(Rejected) as rejected:
+        admission.acquire("a")
+    assert rejected.value.retry_after >= 1
+    # Other clients have buckets of their own
+    tickets.append(admission.acquire("b"))
+    for ticket in tickets:
+        admission.release(ticket)
+    assert admission.stats()["rejected"]["rate_limited"] == 1
+
+
+def test_admission_rejects_when_the_queue_is_full():
+    admission = AdmissionController(max_concurrent=1, max_queue=0, client_rate=0)
+    ticket = admission.acquire("a")
+    with pytest.raises(Rejected):
+        admission.acquire("b")
+    admission.release(ticket)
+    admission.release(admission.acquire("b"))
+    assert admission.stats()["rejected"]["queue_full"] == 1
+
+
+def test_admission_times_out_queued_requests():
+    admission = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=0.05, client_rate=0)
+    ticket = admission.acquire("a")
+    with pytest.raises(Rejected):
+        admission.acquire("b")
+    admission.release(ticket)
+    stats = admission.stats()
+    assert stats["rejected"]["queue_timeout"] == 1
+    assert stats["queue_depth"] == 0 and stats["active"] == 0
+
+
+def test_admission_serves_the_queue_in_order():
+    admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5, client_rate=0)
+    first = admission.acquire("holder")
+    order = []
+
+    def waiter(name):
+        ticket = admission.acquire(name)
+        order.append(name)
+        admission.release(ticket)
+
+    threads = []
+    for name in ("c1", "c2", "c3"):
+        thread = threading.Thread(target=waiter, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # Make sure each one is queued before the next arrives
+        while admission.stats()["queue_depth"] < len(threads):
+            time.sleep(0.005)
+    admission.release(first)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["c1", "c2", "c3"]
+    assert admission.stats()["admitted"] == 4
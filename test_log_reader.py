@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for paging through request logs: ordering across the segments of
+several writer processes, cursors, and the time and field filters.
+
+Run with: python -m pytest -q test_log_reader.py
+"""
+
+import os
+import json
+import pytest
+from agents.log_reader import RequestLogReader, page_args
+
+
+def write_segment(log_dir, name, entries):
+    with open(os.path.join(log_dir, name), 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def entry(day, minute, **fields):
+    return dict({"timestamp": f"{day}T10:{minute:02d}:00", "minute": minute}, **fields)
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    # Two worker processes writing on the same day, plus an older day
+    write_segment(tmp_path, "requests_20261017_000_111.jsonl",
+                  [entry("2026-10-17", m, agents_used=["WEB_SEARCH"]) for m in (1, 3, 5)])
+    write_segment(tmp_path, "requests_20261017_000_222.jsonl",
+                  [entry("2026-10-17", m, agents_used=["ARXIV"], has_pdf=True) for m in (0, 2, 4)])
+    write_segment(tmp_path, "requests_20261016_000_111.jsonl",
+                  [entry("2026-10-16", 50, error="boom")])
+    return str(tmp_path)
+
+
+def minutes(entries):
+    return [e["minute"] for e in entries]
+
+
+def test_segments_of_one_day_are_merged_newest_first(log_dir):
+    entries, cursor = RequestLogReader(log_dir).page()
+    assert minutes(entries) == [5, 4, 3, 2, 1, 0, 50]
+    assert cursor is None
+
+
+def test_cursor_pages_cover_everything_once(log_dir):
+    reader = RequestLogReader(log_dir)
+    seen, cursor = [], None
+    while True:
+        entries, cursor = reader.page(limit=2, cursor=cursor)
+        seen += minutes(entries)
+        if cursor is None:
+            break
+        # Cursors must survive the /logs query-string round trip
+        assert page_args({"cursor": cursor})["cursor"] == cursor
+    assert seen == [5, 4, 3, 2, 1, 0, 50]
+
+
+def test_cursor_skips_segments_started_after_it(log_dir):
+    reader = RequestLogReader(log_dir)
+    _, cursor = reader.page(limit=2)
+    write_segment(log_dir, "requests_20261017_001_333.jsonl", [entry("2026-10-17", 9)])
+    entries, _ = reader.page(limit=10, cursor=cursor)
+    assert minutes(entries) == [3, 2, 1, 0, 50]
+
+
+def test_since_keeps_newer_entries_from_every_segment(log_dir):
+    entries, cursor = RequestLogReader(log_dir).page(since="2026-10-17T10:02:30")
+    assert minutes(entries) == [5, 4, 3]
+    assert cursor is None
+
+
+def test_until_and_since_accept_bare_dates(log_dir):
+    reader = RequestLogReader(log_dir)
+    assert minutes(reader.page(until="2026-10-17")[0]) == [5, 4, 3, 2, 1, 0, 50]
+    assert minutes(reader.page(until="2026-10-16")[0]) == [50]
+    assert minutes(reader.page(since="2026-10-17")[0]) == [5, 4, 3, 2, 1, 0]
+    assert minutes(reader.page(since="2026-10-16", until="2026-10-16")[0]) == [50]
+
+
+def test_field_filters(log_dir):
+    reader = RequestLogReader(log_dir)
+    assert minutes(reader.page(agent="arxiv")[0]) == [4, 2, 0]
+    assert minutes(reader.page(has_pdf=True)[0]) == [4, 2, 0]
+    assert minutes(reader.page(error=True)[0]) == [50]
+
+
+def test_max_scan_returns_a_cursor_to_continue_from(log_dir):
+    reader = RequestLogReader(log_dir, max_scan=2)
+    entries, cursor = reader.page(error=True)
+    assert entries == [] and cursor is not None
+    while not entries and cursor:
+        entries, cursor = reader.page(error=True, cursor=cursor)
+    assert minutes(entries) == [50]
+
+
+def test_index_cache_is_bounded(log_dir):
+    reader = RequestLogReader(log_dir, max_indexes=1)
+    assert len(reader.page()[0]) == 7
+    assert len(reader.indexes) == 1
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        page_args({"cursor": "requests_20261017_000_111.jsonl:x"})
+    with pytest.raises(ValueError):
+        page_args({"cursor": "a.jsonl:1,:2"})
@@ -25,20 +25,18 @@ def test_web_search():
     
     try:
         # Test search functionality
-        results = agent.search_and_summarize(test_query, max_results=3)
+        hits = agent.search_hits(test_query, max_results=3)
+        summary = agent.search(test_query, max_results=3)
         
         print("\n=== Search Results ===")
-        print(f"Summary: {results.get('summary', 'No summary')}")
+        print(f"Summary: {summary or 'No summary'}")
         
-        if 'results' in results and results['results']:
-            print(f"\nFound {len(results['results'])} results:")
-            for i, result in enumerate(results['results'][:3], 1):
-                if 'error' in result:
-                    print(f"{i}. ERROR: {result['error']}")
-                else:
-                    print(f"{i}. {result.get('title', 'No title')}")
-                    print(f"   URL: {result.get('url', 'No URL')}")
-                    print(f"   Snippet: {result.get('snippet', 'No snippet')[:100]}...")
+        if hits:
+            print(f"\nFound {len(hits)} results:")
+            for i, hit in enumerate(hits, 1):
+                print(f"{i}. {hit.title or 'No title'}")
+                print(f"   URL: {hit.url or 'No URL'}")
+                print(f"   Snippet: {(hit.snippet or 'No snippet')[:100]}...")
         else:
             print("No results found or error occurred")
             